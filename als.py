@@ -0,0 +1,123 @@
+"""Matrix-factorization collaborative backend for SmartRecs.
+
+Implicit-feedback ALS (Hu, Koren & Volinsky, 2008) in NumPy: every rating is an
+observed preference with confidence ``1 + alpha * rating``. Training alternates
+closed-form least-squares solves for user and item factors. At request time a
+user's factor is folded in from their current ratings against the fixed item
+factors, so new users and fresh ratings need no retraining, and scoring is one
+``user_factor @ item_factors.T`` product.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from ratings import RatingsStore
+
+
+class ALSModel:
+    """Item factors learned by implicit ALS, plus fold-in scoring for any user."""
+
+    def __init__(
+        self,
+        factors: int = 32,
+        regularization: float = 10.0,
+        alpha: float = 0.5,
+        iterations: int = 10,
+        seed: int = 0,
+    ) -> None:
+        self.factors = factors
+        self.regularization = regularization
+        self.alpha = alpha
+        self.iterations = iterations
+        self.seed = seed
+        self.item_ids = np.zeros(0, dtype=np.int64)
+        self.item_factors = np.zeros((0, factors))
+        self._item_columns: dict[int, int] = {}
+        self._gram = np.zeros((factors, factors))
+
+    def fit(self, ratings: RatingsStore) -> ALSModel:
+        """Train on every rating in the store; returns ``self``."""
+        confidence = sparse.csr_matrix(
+            (self.alpha * ratings.ratings.astype(np.float64), ratings.movie_codes, ratings.indptr),
+            shape=(len(ratings.user_ids), len(ratings.movie_ids)),
+        )
+        by_item = confidence.T.tocsr()
+        rng = np.random.default_rng(self.seed)
+        user_factors = rng.normal(0.0, 0.01, (confidence.shape[0], self.factors))
+        item_factors = rng.normal(0.0, 0.01, (confidence.shape[1], self.factors))
+        for _ in range(self.iterations):
+            user_factors = self._solve(confidence, item_factors)
+            item_factors = self._solve(by_item, user_factors)
+
+        return self.set_factors(ratings.movie_ids, item_factors)
+
+    def set_factors(self, item_ids: np.ndarray, item_factors: np.ndarray) -> ALSModel:
+        """Use trained (or saved, possibly memory-mapped) item factors; returns ``self``."""
+        self.item_ids = item_ids
+        self.item_factors = item_factors
+        self._item_columns = dict(zip(np.asarray(item_ids).tolist(), range(len(item_ids))))
+        self._gram = np.asarray(item_factors.T @ item_factors)
+        return self
+
+    def params(self) -> dict:
+        return {
+            "factors": self.factors,
+            "regularization": self.regularization,
+            "alpha": self.alpha,
+            "iterations": self.iterations,
+            "seed": self.seed,
+        }
+
+    def _solve(self, confidence: sparse.csr_matrix, fixed: np.ndarray) -> np.ndarray:
+        """Least-squares factors for every row of ``confidence`` given the other side's factors.
+
+        Each row's normal equations are formed with one BLAS product; the systems
+        are then solved ``block_size`` at a time as a stacked ``np.linalg.solve``.
+        """
+        gram = fixed.T @ fixed
+        gram[np.diag_indices_from(gram)] += self.regularization
+        solved = np.zeros((confidence.shape[0], self.factors))
+        indptr, indices, data = confidence.indptr, confidence.indices, confidence.data
+        rows = np.flatnonzero(np.diff(indptr))
+        block_size = 1024
+        for start in range(0, len(rows), block_size):
+            block = rows[start : start + block_size]
+            lhs = np.empty((len(block), self.factors, self.factors))
+            rhs = np.empty((len(block), self.factors))
+            for position, row in enumerate(block.tolist()):
+                factors = fixed[indices[indptr[row] : indptr[row + 1]]]
+                weights = data[indptr[row] : indptr[row + 1]]
+                np.add(gram, (factors.T * weights) @ factors, out=lhs[position])
+                rhs[position] = factors.T @ (1.0 + weights)
+            solved[block] = np.linalg.solve(lhs, rhs[..., None])[..., 0]
+        return solved
+
+    def _fold(self, gram: np.ndarray, factors: np.ndarray, confidence: np.ndarray) -> np.ndarray:
+        # (YtY + Yu^T (Cu - I) Yu + reg I) x = Yu^T Cu p(u), with p(u) = 1 on rated items.
+        lhs = gram + (factors.T * confidence) @ factors
+        lhs[np.diag_indices_from(lhs)] += self.regularization
+        return np.linalg.solve(lhs, factors.T @ (1.0 + confidence))
+
+    def user_factor(self, ratings: dict[int, float]) -> np.ndarray:
+        """Fold a user's ``{movie_id: rating}`` into factor space (zeros if none are known)."""
+        columns = np.fromiter((self._item_columns.get(movie_id, -1) for movie_id in ratings), dtype=np.int64, count=len(ratings))
+        values = np.fromiter(ratings.values(), dtype=np.float64, count=len(ratings))
+        known = columns >= 0
+        if not known.any():
+            return np.zeros(self.factors)
+        return self._fold(self._gram, self.item_factors[columns[known]], self.alpha * values[known])
+
+    def scores(self, ratings: dict[int, float]) -> pd.Series | None:
+        """Preference scores for the user's unseen movies, indexed by ``movie_id``.
+
+        Returns ``None`` when the user has no ratings.
+        """
+        if not ratings:
+            return None
+        scores = self.item_factors @ self.user_factor(ratings)
+        unseen = np.ones(len(self.item_ids), dtype=bool)
+        seen = np.fromiter((self._item_columns.get(movie_id, -1) for movie_id in ratings), dtype=np.int64, count=len(ratings))
+        unseen[seen[seen >= 0]] = False
+        return pd.Series(scores[unseen], index=pd.Index(self.item_ids[unseen], name="movie_id"))
@@ -3,26 +3,102 @@ from __future__ import annotations
 import json
 import os
 import re
-from collections import Counter
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import nullcontext
 from functools import lru_cache
 from urllib.parse import quote_plus, urlencode
 from urllib.request import urlopen
 
+import click
+import numpy as np
 import pandas as pd
-from flask import Flask, flash, redirect, render_template, request, session, url_for
+from flask import (
+    Flask,
+    Response,
+    before_render_template,
+    flash,
+    g,
+    get_flashed_messages,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    session,
+    stream_with_context,
+    template_rendered,
+    url_for,
+)
 from werkzeug.security import check_password_hash, generate_password_hash
 
-from models import execute, fetch_all, fetch_one, init_db
+from catalog import normalize_titles
+from ingest import CHUNK_ROWS, import_ratings
+import metrics
+from metrics import record_cache, timed_function, timed_iter
+from models import (
+    active_user_versions,
+    cache_entry_counts,
+    cached_recommendations_current,
+    execute,
+    fetch_all,
+    fetch_one,
+    init_db,
+    load_batch_recommendations,
+    load_cached_recommendations,
+    load_metadata,
+    purge_expired_metadata,
+    rating_change_count,
+    rating_version,
+    store_batch_recommendations,
+    store_cached_recommendations,
+    store_metadata,
+    sync_movie_genres,
+    user_stats,
+)
+from pool import SHARDS_PER_WORKER, ScoringPool
+from ratings import RatingsStore
 from recommender import SmartRecommender
+from refresh import ModelRefresher
+from search import CatalogSearchIndex
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "change-this-in-production")
 
 init_db()
-recommender = SmartRecommender()
-movies_df = pd.read_csv("data/movies.csv")
+# A model saved with `flask save-model` is memory-mapped instead of rebuilt at startup.
+MODEL_PATH = os.getenv("MODEL_PATH", "")
+if MODEL_PATH and os.path.exists(MODEL_PATH):
+    recommender = SmartRecommender.load(MODEL_PATH)
+else:
+    recommender = SmartRecommender(
+        neighbor_k=int(os.getenv("NEIGHBOR_K", "0")) or None,
+        neighbor_mode=os.getenv("NEIGHBOR_INDEX_MODE", "exact"),
+        backend=os.getenv("COLLAB_BACKEND", "user_cosine"),
+        content_k=int(os.getenv("CONTENT_NEIGHBOR_K", "0")) or None,
+        cold_start_below=int(os.getenv("COLD_START_BELOW_RATINGS", "1")),
+        als_params={
+            "factors": int(os.getenv("ALS_FACTORS", "32")),
+            "regularization": float(os.getenv("ALS_REGULARIZATION", "10.0")),
+            "alpha": float(os.getenv("ALS_ALPHA", "0.5")),
+            "iterations": int(os.getenv("ALS_ITERATIONS", "10")),
+        },
+    )
+movies_df = recommender.movies_df
 TMDB_API_KEY = os.getenv("TMDB_API_KEY")
 OMDB_API_KEY = os.getenv("OMDB_API_KEY")
+RECOMMENDATION_CACHE_SIZE = int(os.getenv("RECOMMENDATION_CACHE_SIZE", "5000"))
+MODEL_REFRESH_SECONDS = float(os.getenv("MODEL_REFRESH_SECONDS", "0"))
+MODEL_REFRESH_AFTER_RATINGS = int(os.getenv("MODEL_REFRESH_AFTER_RATINGS", "0"))
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", "1"))
+RECOMMENDATION_COUNT = 12
+OMDB_URL = os.getenv("OMDB_URL", "https://www.omdbapi.com/")
+TMDB_SEARCH_URL = os.getenv("TMDB_SEARCH_URL", "https://api.themoviedb.org/3/search/movie")
+METADATA_PREFETCH_WORKERS = int(os.getenv("METADATA_PREFETCH_WORKERS", "8"))
+METADATA_DEADLINE_SECONDS = float(os.getenv("METADATA_DEADLINE_SECONDS", "2.0"))
+METADATA_TTL_SECONDS = float(os.getenv("METADATA_TTL_SECONDS", str(30 * 24 * 3600)))
+METADATA_NEGATIVE_TTL_SECONDS = float(os.getenv("METADATA_NEGATIVE_TTL_SECONDS", "900"))
+RATE_PAGE_SIZE = 60
 
 POSTER_MAP = {
     "inception": "https://image.tmdb.org/t/p/w500/8IB2e4r4oVhHnANbnm7O3Tj6tF8.jpg",
@@ -124,56 +200,6 @@ STREAM_URL_MAP = {
     "how to train your dragon": "https://moviesjoy.plus/watch-movie/watch-how-to-train-your-dragon-126679.12370606",
 }
 
-YEAR_MAP = {
-    "inception": "2010",
-    "interstellar": "2014",
-    "the matrix": "1999",
-    "the dark knight": "2008",
-    "arrival": "2016",
-    "avatar": "2009",
-    "the prestige": "2006",
-    "blade runner 2049": "2017",
-    "guardians of the galaxy": "2014",
-    "shutter island": "2010",
-    "mad max: fury road": "2015",
-    "the shawshank redemption": "1994",
-    "pulp fiction": "1994",
-    "the godfather": "1972",
-    "whiplash": "2014",
-    "the lord of the rings: the fellowship of the ring": "2001",
-    "the social network": "2010",
-    "parasite": "2019",
-    "dune": "2021",
-    "spider-man: into the spider-verse": "2018",
-    "the grand budapest hotel": "2014",
-    "her": "2013",
-    "la la land": "2016",
-    "the lion king": "1994",
-    "gladiator": "2000",
-    "the silence of the lambs": "1991",
-    "toy story": "1995",
-    "se7en": "1995",
-    "the truman show": "1998",
-    "the departed": "2006",
-    "black panther": "2018",
-    "coco": "2017",
-    "ford v ferrari": "2019",
-    "knives out": "2019",
-    "the martian": "2015",
-    "no country for old men": "2007",
-    "the imitation game": "2014",
-    "inside out": "2015",
-    "a quiet place": "2018",
-    "everything everywhere all at once": "2022",
-    "superman": "2025",
-    "the fantastic four: first steps": "2025",
-    "jurassic world rebirth": "2025",
-    "mission: impossible - the final reckoning": "2025",
-    "tron: ares": "2025",
-    "m3gan 2.0": "2025",
-    "how to train your dragon": "2025",
-}
-
 TRAILER_MAP = {
     "inception": "YoHD9XEInc0",
     "interstellar": "zSWdZVtXT7E",
@@ -278,12 +304,83 @@ EXACT_DESCRIPTIONS = {
     "how to train your dragon": "A young Viking and a wounded dragon forge an unlikely friendship that transforms their world.",
 }
 
-DEFAULT_DESCRIPTIONS = {
-    row["title"].lower(): f"{row['title']} is a {row['genres'].replace('|', ', ')} film with memorable performances and storytelling."
-    for _, row in movies_df.iterrows()
-}
+# Collapses an immediately repeated phrase ("the the matrix") in descriptions.
+REPEATED_PHRASE = re.compile(r"\b(.+?)\s+\1\b", re.IGNORECASE)
+
+
+def prepare_catalog_details(movies: pd.DataFrame) -> pd.DataFrame:
+    """Return a copy of ``movies`` with the display columns derivable without external metadata.
+
+    ``description``, ``pretty_genres``, ``poster_url``, ``trailer_embed_url`` and
+    ``stream_url`` are computed for every row at once from the normalized title
+    columns (including the resolved ``year``, see :func:`catalog.normalize_titles`)
+    and the lookup tables above, so the request path only overlays OMDB/TMDB fields.
+    """
+    movies = movies.copy()
+    clean_title = movies["clean_title"]
+    lower_title = movies["lower_title"]
+    genres = movies["genres"].fillna("").astype(str)
+
+    pretty_genres = genres.str.strip("|").str.replace(r"\|+", ", ", regex=True)
+    movies["pretty_genres"] = pretty_genres.mask(pretty_genres == "", "Genre unavailable")
+    default_descriptions = (
+        clean_title + " is a " + genres.str.replace("|", ", ", regex=False) + " film with memorable performances and storytelling."
+    )
+    descriptions = lower_title.map(EXACT_DESCRIPTIONS).fillna(default_descriptions.mask(genres == "", clean_title))
+    movies["description"] = _collapse_repeated_phrases(descriptions)
+    placeholder_posters = "https://picsum.photos/seed/smartrecs-" + movies["movie_id"].astype(str) + "/480/720"
+    movies["poster_url"] = lower_title.map(POSTER_MAP).fillna(placeholder_posters)
+    trailer_queries = lower_title.map(TRAILER_SEARCH_QUERY_MAP).fillna(clean_title + " official trailer")
+    movies["trailer_embed_url"] = ("https://www.youtube.com/embed/" + lower_title.map(TRAILER_MAP)).fillna(
+        "https://www.youtube.com/embed?listType=search&list=" + trailer_queries.map(quote_plus)
+    )
+    movies["stream_url"] = lower_title.map(STREAM_URL_MAP).fillna("https://moviesjoy.plus/")
+    return movies
+
+
+def _collapse_repeated_phrases(texts: pd.Series) -> pd.Series:
+    """``REPEATED_PHRASE`` collapsed in every text, running the backtracking regex only where it can match.
+
+    A match repeats a word (case-insensitively) unless the phrase has no word
+    characters, which needs whitespace before punctuation or a run of three spaces.
+    """
+    tokens = texts.str.lower().str.findall(r"\w+")
+    candidates = tokens.map(lambda words: len(set(words)) < len(words)) | texts.str.contains(r"\s[^\w\s]|\s{3}")
+    collapsed = texts.copy()
+    collapsed[candidates] = texts[candidates].str.replace(REPEATED_PHRASE, r"\1", regex=True)
+    return collapsed
+
+
+class CatalogDetails:
+    """The app's display copy of the catalog: :func:`prepare_catalog_details` rows plus a search index.
+
+    The recommender's own ``movies_df`` is saved and fingerprinted with the model,
+    so the display columns live in this copy instead.
+    """
+
+    def __init__(self, movies: pd.DataFrame) -> None:
+        self.movies_df = prepare_catalog_details(movies)
+        self.movies = self.movies_df.to_dict(orient="records")
+        self.positions = {movie["movie_id"]: position for position, movie in enumerate(self.movies)}
+        self.search_index = CatalogSearchIndex(self.movies_df)
+
+
+@lru_cache(maxsize=1)
+def catalog_details() -> CatalogDetails:
+    """The :class:`CatalogDetails`, built on first use.
+
+    Under ``gunicorn --preload``, gunicorn.conf.py builds it in the master before
+    forking, so the workers share it copy-on-write.
+    """
+    return CatalogDetails(movies_df)
+
+
+# Genre lists the user_stats triggers aggregate over; a no-op unless the catalog changed.
+_movie_genres = movies_df[["movie_id"]].assign(genre=movies_df["genres"].str.split("|")).explode("genre").dropna()
+sync_movie_genres(zip(_movie_genres["movie_id"].tolist(), _movie_genres["genre"].tolist()))
 
 
+@timed_function("external_http")
 def _safe_json_get(url: str, timeout: float = 1.2) -> dict:
     try:
         with urlopen(url, timeout=timeout) as response:
@@ -292,117 +389,203 @@ def _safe_json_get(url: str, timeout: float = 1.2) -> dict:
         return {}
 
 
-@lru_cache(maxsize=1200)
+def _cached_metadata(source: str, clean_title: str, year: str | None, fetch):
+    """Read-through the shared metadata_cache table; empty results expire sooner."""
+    hit, payload = load_metadata(source, clean_title, year or "")
+    record_cache(source, hit)
+    if hit:
+        return payload
+    payload = fetch() or None
+    ttl = METADATA_TTL_SECONDS if payload is not None else METADATA_NEGATIVE_TTL_SECONDS
+    store_metadata(source, clean_title, year or "", payload, ttl)
+    return payload
+
+
 def omdb_movie_data(clean_title: str, year: str | None) -> dict:
     if not OMDB_API_KEY:
         return {}
-    params = {"apikey": OMDB_API_KEY, "t": clean_title}
-    if year and year.isdigit():
-        params["y"] = year
-    data = _safe_json_get(f"https://www.omdbapi.com/?{urlencode(params)}")
-    return data if data.get("Response") == "True" else {}
+
+    def fetch() -> dict:
+        params = {"apikey": OMDB_API_KEY, "t": clean_title}
+        if year and year.isdigit():
+            params["y"] = year
+        data = _safe_json_get(f"{OMDB_URL}?{urlencode(params)}")
+        return data if data.get("Response") == "True" else {}
+
+    return _cached_metadata("omdb", clean_title, year, fetch) or {}
 
 
-@lru_cache(maxsize=1200)
 def tmdb_poster_url(clean_title: str, year: str) -> str | None:
     if not TMDB_API_KEY:
         return None
-    params = {"api_key": TMDB_API_KEY, "query": clean_title}
-    if year.isdigit():
-        params["year"] = year
-    data = _safe_json_get(f"https://api.themoviedb.org/3/search/movie?{urlencode(params)}")
-    results = data.get("results", [])
-    if not results:
-        return None
-    path = results[0].get("poster_path")
-    return f"https://image.tmdb.org/t/p/w500{path}" if path else None
-
-
-def movie_with_details(movie: dict) -> dict:
-    movie_copy = dict(movie)
-    raw_title = movie_copy.get("title", "")
-    year_match = re.search(r"\((\d{4})\)\s*$", raw_title)
-    parsed_year = year_match.group(1) if year_match else None
-    clean_title = re.sub(r"\s*\(\d{4}\)\s*$", "", raw_title).strip()
-    lower_title = clean_title.lower()
-
-    resolved_year = parsed_year or YEAR_MAP.get(lower_title, "2000")
-    omdb = omdb_movie_data(clean_title, resolved_year)
-
-    genres = movie_copy.get("genres", "")
-    genre_list = [g for g in genres.split("|") if g]
-    pretty_genres = omdb.get("Genre") or ", ".join(genre_list) or "Genre unavailable"
-
-    omdb_year = str(omdb.get("Year") or "")
-    omdb_released = str(omdb.get("Released") or "")
-    year_match = re.search(r"(\d{4})", omdb_year) or re.search(r"(\d{4})", omdb_released)
-    release_date = year_match.group(1) if year_match else resolved_year
-
-    plot = omdb.get("Plot")
-    description = plot if plot and plot != "N/A" else EXACT_DESCRIPTIONS.get(lower_title, DEFAULT_DESCRIPTIONS.get(lower_title, clean_title))
-    description = re.sub(r"\b(.+?)\s+\1\b", r"\1", description, flags=re.IGNORECASE)
-
-    movie_id = movie_copy.get("movie_id", movie_copy.get("id", 0))
-    poster_url = (
-    (omdb.get("Poster") if omdb.get("Poster") and omdb.get("Poster") != "N/A" else None)
-    or tmdb_poster_url(clean_title, resolved_year)
-    or POSTER_MAP.get(lower_title)
-    or f"https://picsum.photos/seed/smartrecs-{movie_id}/480/720"
-)
-    
-    trailer_id = TRAILER_MAP.get(lower_title)
-    trailer_search_query = TRAILER_SEARCH_QUERY_MAP.get(
-        lower_title, f"{clean_title} official trailer"
-    )
-    fallback_query = quote_plus(trailer_search_query)
-
-    movie_copy["clean_title"] = clean_title
-    movie_copy["year"] = resolved_year
-    movie_copy["release_date"] = release_date
-    movie_copy["description"] = description
-    movie_copy["pretty_genres"] = pretty_genres
-    movie_copy["poster_url"] = poster_url or f"https://picsum.photos/seed/smartrecs-{movie_id}/480/720"
-
-    movie_copy["trailer_embed_url"] = (
-        f"https://www.youtube.com/embed/{trailer_id}"
-        if trailer_id
-        else f"https://www.youtube.com/embed?listType=search&list={fallback_query}"
-    )
-    movie_copy["stream_url"] = STREAM_URL_MAP.get(lower_title, "https://moviesjoy.plus/")
-    return movie_copy
 
+    def fetch() -> str | None:
+        params = {"api_key": TMDB_API_KEY, "query": clean_title}
+        if year.isdigit():
+            params["year"] = year
+        data = _safe_json_get(f"{TMDB_SEARCH_URL}?{urlencode(params)}")
+        results = data.get("results", [])
+        if not results:
+            return None
+        path = results[0].get("poster_path")
+        return f"https://image.tmdb.org/t/p/w500{path}" if path else None
 
+    return _cached_metadata("tmdb", clean_title, year, fetch)
 
 
-def filter_movies(movies: list[dict], query: str, year: str, genre: str) -> list[dict]:
-    search = (query or "").strip().lower()
-    year_filter = (year or "").strip()
-    genre_filter = (genre or "").strip().lower()
-
-    def matches(movie: dict) -> bool:
-        title = str(movie.get("clean_title") or movie.get("title") or "").lower()
-        movie_year = str(movie.get("year") or "")
-        movie_genres = str(movie.get("pretty_genres") or movie.get("genres") or "").replace("|", ",").lower()
-
-        if search and search not in title:
-            return False
-        if year_filter and year_filter != movie_year:
-            return False
-        if genre_filter and genre_filter not in movie_genres:
-            return False
+_metadata_executor = ThreadPoolExecutor(max_workers=METADATA_PREFETCH_WORKERS, thread_name_prefix="metadata")
+# Lookups in flight, shared by request threads and the executor's done-callbacks.
+_metadata_inflight: dict[tuple, Future] = {}
+_metadata_lock = threading.Lock()
+_DONE: Future = Future()
+_DONE.set_result(None)
+
+
+def _catalog_row(movie: dict) -> dict:
+    """The prepared catalog row for ``movie``; rows not in the catalog are prepared on the fly."""
+    movie_id = int(movie.get("movie_id") or movie.get("id") or 0)
+    title = str(movie.get("title") or "")
+    details = catalog_details()
+    position = details.positions.get(movie_id)
+    if position is not None and details.movies[position]["title"] == title:
+        return details.movies[position]
+    row = pd.DataFrame({"movie_id": [movie_id], "title": [title], "genres": [str(movie.get("genres") or "")]})
+    return prepare_catalog_details(normalize_titles(row)).to_dict(orient="records")[0]
+
+
+def _metadata_lookups(movie: dict) -> list[tuple]:
+    row = _catalog_row(movie)
+    clean_title, year = row["clean_title"], row["year"]
+    return [(omdb_movie_data, clean_title, year), (tmdb_poster_url, clean_title, year)]
+
+
+def prefetch_metadata(movies: list[dict], deadline: float = METADATA_DEADLINE_SECONDS) -> bool:
+    """Fan out the OMDB/TMDB lookups of a page of movies on a bounded thread pool.
+
+    Waits at most ``deadline`` seconds for the whole batch and returns whether every
+    lookup finished. Lookups still running keep going in the background and land in
+    the shared metadata cache for later requests.
+    """
+    if not (OMDB_API_KEY or TMDB_API_KEY):
         return True
+    futures = [_metadata_future(lookup) for movie in movies for lookup in _metadata_lookups(movie)]
+    _, pending = wait(futures, timeout=deadline)
+    return not pending
+
+
+def _metadata_future(lookup: tuple) -> Future:
+    """The in-flight future for ``lookup``, submitting it unless one is already running."""
+    with _metadata_lock:
+        future = _metadata_inflight.get(lookup)
+        if future is not None:
+            return future
+        future = _metadata_executor.submit(*lookup)
+        _metadata_inflight[lookup] = future
+    # Outside the lock: a future that already finished runs the callback right here.
+    future.add_done_callback(lambda done, key=lookup: _forget_metadata_future(key, done))
+    return future
+
+
+def _forget_metadata_future(lookup: tuple, future: Future) -> None:
+    with _metadata_lock:
+        if _metadata_inflight.get(lookup) is future:
+            del _metadata_inflight[lookup]
+
+
+def _metadata_pending(movie: dict) -> bool:
+    """Whether a lookup for ``movie`` is still running (it missed a prefetch deadline)."""
+    lookups = _metadata_lookups(movie)
+    with _metadata_lock:
+        return any(not _metadata_inflight.get(lookup, _DONE).done() for lookup in lookups)
+
+
+def movie_with_details(movie: dict, pending: bool = False) -> dict:
+    """Enrich a catalog row for display.
+
+    The local fields come precomputed from :func:`prepare_catalog_details`; OMDB and
+    TMDB fields override them when available. With ``pending=True`` (lookups still
+    in flight after a prefetch deadline) the external metadata is skipped instead
+    of blocking.
+    """
+    movie_copy = dict(_catalog_row(movie))
+    movie_copy.update(movie)
+    clean_title, year = movie_copy["clean_title"], movie_copy["year"]
+    omdb = {} if pending else omdb_movie_data(clean_title, year)
+
+    movie_copy["release_date"] = year
+    if omdb:
+        movie_copy["pretty_genres"] = omdb.get("Genre") or movie_copy["pretty_genres"]
+        year_match = re.search(r"(\d{4})", str(omdb.get("Year") or "")) or re.search(
+            r"(\d{4})", str(omdb.get("Released") or "")
+        )
+        if year_match:
+            movie_copy["release_date"] = year_match.group(1)
+        plot = omdb.get("Plot")
+        if plot and plot != "N/A":
+            movie_copy["description"] = REPEATED_PHRASE.sub(r"\1", plot)
+
+    poster = omdb.get("Poster")
+    poster = poster if poster and poster != "N/A" else None
+    if not poster and not pending:
+        poster = tmdb_poster_url(clean_title, year)
+    if poster:
+        movie_copy["poster_url"] = poster
+    return movie_copy
+
+
+def filter_movies(movies: list[dict], query: str, year: str, genre: str) -> list[dict]:
+    """Keep the movies matching the filters, in order, using the catalog search index."""
+    if not any((value or "").strip() for value in (query, year, genre)):
+        return list(movies)
+    matching = catalog_details().search_index.matching_ids(query, year, genre)
+    return [movie for movie in movies if movie.get("movie_id") in matching]
+
+def stream_page(template_name: str, **context) -> Response:
+    """Render a template as a streamed response so the first bytes leave immediately."""
+    # Pop flashed messages into the request context now: once streaming starts the
+    # session cookie (which stores them) can no longer be updated.
+    get_flashed_messages(with_categories=True)
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(8)
+    return Response(stream_with_context(timed_iter(stream, f"render.{template_name}")), mimetype="text/html")
+
+
+@before_render_template.connect_via(app)
+def _start_render_timer(sender, template, context, **extra) -> None:
+    g.setdefault("render_started", {})[id(context)] = time.perf_counter()
+
+
+@template_rendered.connect_via(app)
+def _stop_render_timer(sender, template, context, **extra) -> None:
+    started = g.get("render_started", {}).pop(id(context), None)
+    if started is not None:
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage=f"render.{template.name}")
 
-    return [movie for movie in movies if matches(movie)]
 
 def current_user_id() -> int | None:
     return session.get("user_id")
 
 
-def load_app_ratings() -> pd.DataFrame:
-    rows = fetch_all("SELECT user_id, movie_id, rating FROM user_ratings")
-    if not rows:
-        return pd.DataFrame(columns=["user_id", "movie_id", "rating"])
-    return pd.DataFrame([dict(r) for r in rows])
+@timed_function("load_app_ratings")
+def load_app_ratings() -> RatingsStore:
+    return RatingsStore.from_rows(fetch_all("SELECT user_id, movie_id, rating FROM user_ratings"))
+
+
+if not recommender.loaded_from:
+    recommender.bulk_load(load_app_ratings())
+model_refresher = ModelRefresher(
+    recommender,
+    load_app_ratings,
+    rating_change_count,
+    interval=MODEL_REFRESH_SECONDS,
+    after_changes=MODEL_REFRESH_AFTER_RATINGS,
+)
+
+
+@app.before_request
+def start_model_refresher() -> None:
+    model_refresher.ensure_started()
 
 
 @app.route("/")
@@ -519,22 +702,9 @@ def dashboard():
     if not user_id:
         return redirect(url_for("login"))
 
-    ratings = fetch_all("SELECT movie_id, rating FROM user_ratings WHERE user_id = ?", (user_id,))
-    rating_count = len(ratings)
-
-    top_genre = "N/A"
-    score_pct = 0
-    if ratings:
-        rated_movie_ids = [r["movie_id"] for r in ratings]
-        rated_movies = movies_df[movies_df["movie_id"].isin(rated_movie_ids)]
-        genre_counter = Counter()
-        for genre_str in rated_movies["genres"]:
-            for genre in genre_str.split("|"):
-                genre_counter[genre] += 1
-        if genre_counter:
-            top_genre = genre_counter.most_common(1)[0][0]
-        avg_rating = sum(r["rating"] for r in ratings) / rating_count
-        score_pct = int((avg_rating / 5.0) * 100)
+    rating_count, rating_sum, top_genre = user_stats(user_id)
+    score_pct = int((rating_sum / rating_count / 5.0) * 100) if rating_count else 0
+    top_genre = top_genre or "N/A"
 
     return render_template(
         "dashboard.html",
@@ -546,37 +716,206 @@ def dashboard():
     )
 
 
-def _ratings_signature(user_id: int) -> str:
-    rows = fetch_all("SELECT movie_id, rating FROM user_ratings WHERE user_id = ? ORDER BY movie_id", (user_id,))
-    return "|".join(f"{r['movie_id']}:{r['rating']}" for r in rows)
+def _compute_recommendations(user_id: int, model_version: str) -> tuple[list[dict], bool]:
+    """The user's recommendations with details, and whether every row got its external metadata."""
+    batch = load_batch_recommendations(user_id, model_version)
+    # A persistent miss rate here means the batch job scored with another model than this worker's.
+    record_cache("batch_recommendations", batch is not None)
+    if batch is not None:
+        recs = recommender.movies_with_scores([movie_id for movie_id, _ in batch], [score for _, score in batch])
+    else:
+        # Another worker may have written this user's ratings; refresh just their row.
+        rows = fetch_all("SELECT movie_id, rating FROM user_ratings WHERE user_id = ?", (user_id,))
+        recommender.sync_user_ratings(user_id, {row["movie_id"]: row["rating"] for row in rows})
+        recs = recommender.recommend(user_id, top_n=RECOMMENDATION_COUNT)
+    return _movies_with_details(recs.to_dict(orient="records"))
+
+
+def get_recommendations(user_id: int):
+    """Serve from the shared cache, then the offline batch, then online scoring.
+
+    See :func:`_recommendations_entry`.
+    """
+    return _recommendations_entry(user_id)[0]
+
+
+def _recommendations_entry(user_id: int) -> tuple[list[dict], str, str | None]:
+    """The user's recommendations, the model version that built them and their cache entry's ETag.
+
+    Both stores are keyed by the user's ratings version and the model version, so
+    a new rating or a refreshed model makes them miss and the user is scored online
+    until the next batch run. A list
+    whose metadata lookups missed the prefetch deadline is served but not cached,
+    so the next request picks up the fetched posters and plots; it has no ETag.
+    """
+    model_version = recommender.model_version
+    # Read the version first: a rating written meanwhile leaves the entry (and its tag) stale, never ahead.
+    version = rating_version(user_id)
+    etag = f"{user_id}-{version}-{model_version}"
+    cached = load_cached_recommendations(user_id, model_version)
+    record_cache("recommendations", cached is not None)
+    if cached is not None:
+        return cached, model_version, etag
+    recommendations, complete = _compute_recommendations(user_id, model_version)
+    # A snapshot swapped in mid-computation may have scored the list; don't file it under the old model.
+    if complete and recommender.model_version == model_version:
+        store_cached_recommendations(user_id, model_version, version, recommendations, RECOMMENDATION_CACHE_SIZE)
+        return recommendations, model_version, etag
+    return recommendations, model_version, None
+
+
+def _etag_current(user_id: int, etag: str) -> bool:
+    """Whether ``etag`` (``user-ratings version-model version``) names the entry this worker would serve now.
+
+    The tag's model must be the live one: after a refresh or compaction the old
+    model's entry may still be cached, but a GET would score a different list.
+    """
+    tag_user, _, rest = etag.partition("-")
+    version, _, model_version = rest.partition("-")
+    return (
+        tag_user == str(user_id)
+        and version.isdigit()
+        and model_version == recommender.model_version
+        and cached_recommendations_current(user_id, model_version, int(version))
+    )
 
 
-@lru_cache(maxsize=256)
-def _cached_recommendations(user_id: int, signature: str):
-    app_ratings = load_app_ratings()
-    recs = recommender.recommend(user_id, app_ratings, top_n=12)
-    return [movie_with_details_cached(movie) for movie in recs.to_dict(orient="records")]
+@app.cli.command("warm-metadata-cache")
+@click.option("--deadline", default=600.0, show_default=True, help="Seconds to wait for all lookups.")
+def warm_metadata_cache(deadline: float) -> None:
+    """Fetch OMDB/TMDB metadata for the whole catalog into the shared metadata cache."""
+    purged = purge_expired_metadata()
+    movies = movies_df.to_dict(orient="records")
+    complete = prefetch_metadata(movies, deadline=deadline)
+    status = "complete" if complete else "incomplete (deadline reached)"
+    click.echo(f"Warmed metadata for {len(movies)} movies, {status}; purged {purged} expired entries.")
+
+
+@app.cli.command("import-ratings")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--chunk-rows", default=CHUNK_ROWS, show_default=True, help="CSV rows validated and committed per batch.")
+@click.option(
+    "--defer-triggers",
+    is_flag=True,
+    help="Drop user_ratings' triggers during the load and redo their work once at the end (one long transaction).",
+)
+def import_ratings_command(path: str, chunk_rows: int, defer_triggers: bool) -> None:
+    """Bulk-import a user_id,movie_id,rating CSV into user_ratings (safe to re-run)."""
+    report = import_ratings(
+        path,
+        movie_ids=movies_df["movie_id"].to_numpy(),
+        chunk_rows=chunk_rows,
+        defer_triggers=defer_triggers,
+        progress=lambda report: click.echo(f"  {report.rows_read} rows, {report.rows_per_second:,.0f} rows/s", err=True),
+    )
+    click.echo(report.summary())
 
 
-def get_recommendations(user_id: int):
-    return _cached_recommendations(user_id, _ratings_signature(user_id))
+@app.cli.command("save-model")
+@click.option("--out", default=MODEL_PATH or "models/current", show_default=True, help="Model path (a symlink to the saved version).")
+def save_model(out: str) -> None:
+    """Save the live recommender model so workers can memory-map it via MODEL_PATH."""
+    try:
+        saved = recommender.save(out)
+    except ValueError as error:
+        raise click.UsageError(str(error)) from error
+    click.echo(f"Saved model {recommender.model_version} to {saved} ({out} points at it).")
+
+
+@app.cli.command("precompute-recommendations")
+@click.option("--top-n", default=RECOMMENDATION_COUNT, show_default=True, help="Recommendations stored per user.")
+@click.option("--batch-size", default=256, show_default=True, help="Users scored per matrix product.")
+@click.option("--workers", default=SCORING_WORKERS, show_default=True, help="Scoring processes (1 = in this process).")
+def precompute_recommendations(top_n: int, batch_size: int, workers: int) -> None:
+    """Score every user with in-app ratings and store their top-N in user_recommendations.
+
+    Workers serve a list only while they run the model that scored it, so the job
+    scores with the saved model they load (MODEL_PATH) rather than one built from
+    the database as it is now, whose version no worker would match.
+    """
+    if not recommender.loaded_from:
+        raise click.UsageError(
+            "precompute-recommendations needs the model the web workers load: save one with "
+            "`flask --app app save-model` and set MODEL_PATH for both the workers and this job."
+        )
+    model_version = recommender.model_version
+    if MODEL_REFRESH_SECONDS or MODEL_REFRESH_AFTER_RATINGS:
+        click.echo(
+            f"Warning: MODEL_REFRESH_* is set, so workers replace model {model_version} on their first "
+            "refresh; lists stored now stop being served then.",
+            err=True,
+        )
+    versions = active_user_versions()
+    user_ids = sorted(versions)
+    scorer = ScoringPool(recommender, workers) if workers > 1 else nullcontext(recommender)
+    with scorer as scoring:
+        # Each chunk is stored as soon as it is scored; a pool spreads it across its workers.
+        chunk_size = batch_size * max(1, workers) * SHARDS_PER_WORKER if workers > 1 else batch_size
+        for start in range(0, len(user_ids), chunk_size):
+            block = user_ids[start : start + chunk_size]
+            results = scoring.recommend_many(block, top_n=top_n, block_size=batch_size)
+            store_batch_recommendations(
+                model_version,
+                [
+                    (user_id, versions[user_id], list(zip(results[user_id]["movie_id"].tolist(), results[user_id]["score"].tolist())))
+                    for user_id in block
+                ]
+            )
+    click.echo(f"Precomputed recommendations for {len(user_ids)} users with model {model_version} ({recommender.loaded_from}).")
 
 
 @lru_cache(maxsize=6000)
-def _movie_details_cached(movie_id: int, title: str, genres: str) -> dict:
+def _movie_details_cached(movie_id: int, title: str, genres: str, ttl_window: int) -> dict:
     return movie_with_details({"movie_id": movie_id, "title": title, "genres": genres})
 
 
-def movie_with_details_cached(movie: dict) -> dict:
+def movie_with_details_cached(movie: dict, pending: bool | None = None) -> dict:
     movie_id = int(movie.get("movie_id") or movie.get("id") or 0)
     title = str(movie.get("title") or "")
     genres = str(movie.get("genres") or "")
-    details = _movie_details_cached(movie_id, title, genres)
+    if pending is None:
+        pending = _metadata_pending(movie)
+    if pending:
+        # Don't block on (or cache) a lookup that missed the prefetch deadline.
+        details = movie_with_details({"movie_id": movie_id, "title": title, "genres": genres}, pending=True)
+    else:
+        # Rebuilt once per negative-TTL window so expired metadata failures get retried.
+        ttl_window = int(time.time() // METADATA_NEGATIVE_TTL_SECONDS)
+        details = _movie_details_cached(movie_id, title, genres, ttl_window)
     merged = dict(movie)
     merged.update(details)
     return merged
 
 
+@metrics.CACHE_REQUESTS.collector
+def _movie_details_cache_requests() -> dict:
+    info = _movie_details_cached.cache_info()
+    return {("movie_details", "hit"): info.hits, ("movie_details", "miss"): info.misses}
+
+
+@metrics.CACHE_ENTRIES.collector
+def _cache_entries() -> dict:
+    counts = {(name,): entries for name, entries in cache_entry_counts().items()}
+    counts[("movie_details",)] = _movie_details_cached.cache_info().currsize
+    return counts
+
+
+def movies_with_details(movies: list[dict]) -> list[dict]:
+    """``movie_with_details_cached`` for a page of movies, prefetching metadata concurrently."""
+    return _movies_with_details(movies)[0]
+
+
+def _movies_with_details(movies: list[dict]) -> tuple[list[dict], bool]:
+    """:func:`movies_with_details` plus whether no row fell back for a lookup past the deadline."""
+    complete = prefetch_metadata(movies)
+    detailed = []
+    for movie in movies:
+        pending = _metadata_pending(movie)
+        complete = complete and not pending
+        detailed.append(movie_with_details_cached(movie, pending))
+    return detailed, complete
+
+
 def get_user_rated_movies(user_id: int) -> list[dict]:
     rated_rows = fetch_all("SELECT movie_id, rating FROM user_ratings WHERE user_id = ?", (user_id,))
     if not rated_rows:
@@ -585,8 +924,7 @@ def get_user_rated_movies(user_id: int) -> list[dict]:
     rating_map = {row["movie_id"]: row["rating"] for row in rated_rows}
     rated_movies = movies_df[movies_df["movie_id"].isin(rating_map.keys())].to_dict(orient="records")
     detailed_movies = []
-    for movie in rated_movies:
-        movie_detail = movie_with_details_cached(movie)
+    for movie, movie_detail in zip(rated_movies, movies_with_details(rated_movies)):
         movie_detail["user_rating"] = rating_map.get(movie["movie_id"])
         movie_detail["is_rated"] = True
         detailed_movies.append(movie_detail)
@@ -611,25 +949,41 @@ def rate_movies():
             """,
             (user_id, movie_id, rating),
         )
-        _cached_recommendations.cache_clear()
+        recommender.upsert_rating(user_id, movie_id, rating)
         flash("Rating saved successfully!", "success")
         return redirect(url_for("rate_movies"))
 
     search = request.args.get("search", "")
     year = request.args.get("year", "")
     genre = request.args.get("genre", "")
+    after = request.args.get("after", type=int)
+
+    # Query the catalog search index, then enrich only the requested page. The cursor is the
+    # last movie_id of the previous page; matches stay in catalog order.
+    details = catalog_details()
+    matches = details.search_index.search(search, year, genre)
+    start = 0
+    if after in details.positions:
+        start = int(np.searchsorted(matches, details.positions[after], side="right"))
+    page = [details.movies[position] for position in matches[start : start + RATE_PAGE_SIZE].tolist()]
+    next_cursor = page[-1]["movie_id"] if start + len(page) < len(matches) else None
 
     rated_rows = fetch_all("SELECT movie_id, rating FROM user_ratings WHERE user_id = ?", (user_id,))
     rating_map = {row["movie_id"]: row["rating"] for row in rated_rows}
-    all_movies = movies_df.to_dict(orient="records")
-    detailed_movies = []
-    for movie in all_movies:
-        movie_detail = movie_with_details_cached(movie)
-        movie_detail["user_rating"] = rating_map.get(movie["movie_id"])
-        detailed_movies.append(movie_detail)
-
-    filtered_movies = filter_movies(detailed_movies, search, year, genre)
-    return render_template("rate.html", movies=filtered_movies, active_tab="rate", search=search, year=year, genre=genre)
+    detailed_movies = movies_with_details(page)
+    for movie_detail in detailed_movies:
+        movie_detail["user_rating"] = rating_map.get(movie_detail["movie_id"])
+
+    return stream_page(
+        "rate.html",
+        movies=detailed_movies,
+        active_tab="rate",
+        search=search,
+        year=year,
+        genre=genre,
+        next_cursor=next_cursor,
+        is_first_page=start == 0,
+    )
 
 
 @app.route("/recommendations")
@@ -642,7 +996,13 @@ def recommendations():
     year = request.args.get("year", "")
     genre = request.args.get("genre", "")
 
-    recommendations_list = get_recommendations(user_id)
+    has_ratings = bool(fetch_one("SELECT 1 FROM user_ratings WHERE user_id = ? LIMIT 1", (user_id,)))
+    if has_ratings:
+        recommendations_list = get_recommendations(user_id)
+    else:
+        # Cold start: the popularity ranking, sliced by the genre/year filters.
+        popular = recommender.popular(RECOMMENDATION_COUNT, genre=genre or None, year=year or None)
+        recommendations_list = movies_with_details(popular.to_dict(orient="records"))
     rated_movies = get_user_rated_movies(user_id)
 
     merged_recommendations = list(recommendations_list)
@@ -654,8 +1014,6 @@ def recommendations():
 
     filtered_recommendations = filter_movies(merged_recommendations, search, year, genre)
 
-    has_ratings = bool(fetch_one("SELECT 1 FROM user_ratings WHERE user_id = ? LIMIT 1", (user_id,)))
-
     return render_template(
         "recommendations.html",
         recommendations=filtered_recommendations,
@@ -674,10 +1032,44 @@ def reset_ratings():
         return redirect(url_for("login"))
 
     execute("DELETE FROM user_ratings WHERE user_id = ?", (user_id,))
-    _cached_recommendations.cache_clear()
+    recommender.delete_user_ratings(user_id)
     flash("All ratings were reset.", "success")
     return redirect(url_for("dashboard"))
 
 
+
+@app.route("/api/recommendations")
+def api_recommendations():
+    """The user's recommendations with scores and movie details, as JSON.
+
+    The strong ETag names the shared cache entry the body came from (the user's
+    ratings version and the model version that built it), so an If-None-Match
+    naming an entry that is still valid for the live model gets a 304 without
+    scoring or rendering anything, from any worker running that model.
+    """
+    user_id = current_user_id()
+    if not user_id:
+        return jsonify(error="Sign in required."), 401
+
+    for etag in request.if_none_match.as_set(include_weak=True):
+        if _etag_current(user_id, etag):
+            response = Response(status=304)
+            break
+    else:
+        recommendations, model_version, etag = _recommendations_entry(user_id)
+        response = jsonify(user_id=user_id, model_version=model_version, recommendations=recommendations)
+    if etag is not None:
+        response.set_etag(etag)
+    # Per-user data: shared caches may store it only to revalidate, never to serve as-is.
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Cookie")
+    return response
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=True)
@@ -0,0 +1,349 @@
+"""Benchmarks for the SmartRecs recommender.
+
+Usage:
+    python benchmark.py neighbors --ratings data/ratings.csv --k 50
+    python benchmark.py generate --ratings 1m --out data/synthetic/1m
+    python benchmark.py recommend --data data/synthetic/1m --out results/1m.json
+    python benchmark.py backends --data data/synthetic/1m --k 10
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from catalog import build_catalog
+from neighbors import NeighborIndex
+from ratings import RatingsStore
+from recommender import COLLAB_BACKENDS, SmartRecommender, UserItemMatrix
+
+GENRES = [
+    "Drama", "Comedy", "Thriller", "Action", "Romance", "Adventure", "Crime", "Sci-Fi", "Horror", "Fantasy",
+    "Children", "Animation", "Mystery", "Documentary", "War", "Musical", "Western", "Film-Noir", "IMAX",
+]
+# Relative genre frequencies, roughly as in MovieLens.
+GENRE_WEIGHTS = np.array([25, 17, 9, 8, 8, 5, 5, 4, 5, 4, 3, 3, 3, 3, 2, 1, 1, 0.5, 0.5])
+
+
+def load_ratings(path: str) -> pd.DataFrame:
+    """Read a ratings CSV in either SmartRecs or MovieLens (userId/movieId) column naming."""
+    ratings = pd.read_csv(path)
+    ratings = ratings.rename(columns={"userId": "user_id", "movieId": "movie_id"})
+    return ratings[["user_id", "movie_id", "rating"]]
+
+
+def recall_at_k(approx: NeighborIndex, exact: NeighborIndex, user_ids: list[int]) -> float:
+    """Mean share of each user's exact top-K neighbors that the approximate index also returns."""
+    recalls = []
+    for user_id in user_ids:
+        truth = set(exact.neighbors(user_id).index)
+        if truth:
+            recalls.append(len(truth & set(approx.neighbors(user_id).index)) / len(truth))
+    return float(np.mean(recalls)) if recalls else 1.0
+
+
+def bench_neighbors(args: argparse.Namespace) -> None:
+    ratings = load_ratings(args.ratings)
+    user_items = UserItemMatrix(RatingsStore.from_frame(ratings))
+    rng = np.random.default_rng(args.seed)
+    user_ids = user_items.user_ids.to_numpy()
+    sample = rng.choice(user_ids, size=min(args.sample, len(user_ids)), replace=False).tolist()
+    print(f"ratings={len(ratings)} users={len(user_ids)} movies={len(user_items.movie_ids)} k={args.k}")
+
+    indexes = {}
+    for mode in ("exact", "lsh"):
+        started = time.perf_counter()
+        indexes[mode] = NeighborIndex(user_items, k=args.k, mode=mode, n_tables=args.tables, n_bits=args.bits, seed=args.seed)
+        print(f"build[{mode}]: {time.perf_counter() - started:.3f}s")
+
+    print(f"recall@{args.k} (lsh vs brute force): {recall_at_k(indexes['lsh'], indexes['exact'], sample):.4f}")
+
+    timings = {"brute": [], "exact": [], "lsh": []}
+    for user_id in sample:
+        started = time.perf_counter()
+        user_items.predict(user_id)
+        timings["brute"].append(time.perf_counter() - started)
+        for mode, index in indexes.items():
+            started = time.perf_counter()
+            user_items.predict(user_id, index.neighbors(user_id))
+            timings[mode].append(time.perf_counter() - started)
+    for name, values in timings.items():
+        print(f"collab[{name}]: mean {1000 * np.mean(values):.3f} ms  p95 {1000 * np.percentile(values, 95):.3f} ms")
+
+
+def count(value: str) -> int:
+    """Parse a size such as ``100000``, ``100k`` or ``10m``."""
+    value = value.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    return int(float(value[:-1] if scale > 1 else value) * scale)
+
+
+def generate_movies(n_movies: int, rng: np.random.Generator) -> pd.DataFrame:
+    """A MovieLens-shaped catalog: ``Title (year)`` and 1-3 pipe-separated genres."""
+    years = np.clip(np.round(2024 - rng.gamma(2.0, 12.0, n_movies)), 1920, 2023).astype(int)
+    genre_p = GENRE_WEIGHTS / GENRE_WEIGHTS.sum()
+    n_genres = rng.choice([1, 2, 3], size=n_movies, p=[0.4, 0.4, 0.2])
+    genres = [
+        "|".join(GENRES[g] for g in sorted(rng.choice(len(GENRES), size=n, replace=False, p=genre_p)))
+        for n in n_genres.tolist()
+    ]
+    movie_ids = np.arange(1, n_movies + 1)
+    titles = [f"Synthetic Movie {movie_id} ({year})" for movie_id, year in zip(movie_ids.tolist(), years.tolist())]
+    return pd.DataFrame({"movie_id": movie_ids, "title": titles, "genres": genres})
+
+
+def generate_ratings(n_ratings: int, n_users: int, n_movies: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Long-tail ratings: Zipf-like movie popularity, log-normal user activity, 0.5-5 stars."""
+    popularity = 1.0 / np.arange(1, n_movies + 1) ** 0.9
+    popularity = rng.permutation(popularity / popularity.sum())
+    activity = rng.lognormal(0.0, 1.2, n_users)
+    activity /= activity.sum()
+    quality = rng.normal(3.5, 0.5, n_movies)
+    leniency = rng.normal(0.0, 0.4, n_users)
+
+    # Draw (user, movie) pairs until enough distinct ones exist; a user rates a movie once.
+    pairs = pd.DataFrame({"user_id": np.zeros(0, dtype=np.int64), "movie_id": np.zeros(0, dtype=np.int64)})
+    limit = n_users * n_movies
+    while len(pairs) < min(n_ratings, limit):
+        draw = int((n_ratings - len(pairs)) * 1.1) + 16
+        fresh = pd.DataFrame({"user_id": rng.choice(n_users, draw, p=activity), "movie_id": rng.choice(n_movies, draw, p=popularity)})
+        pairs = pd.concat([pairs, fresh], ignore_index=True).drop_duplicates()
+    pairs = pairs.iloc[:n_ratings]
+
+    users, movies = pairs["user_id"].to_numpy(), pairs["movie_id"].to_numpy()
+    stars = quality[movies] + leniency[users] + rng.normal(0.0, 0.8, len(pairs))
+    ratings = pd.DataFrame(
+        {"user_id": users + 1, "movie_id": movies + 1, "rating": np.clip(np.round(stars * 2) / 2, 0.5, 5.0)}
+    )
+    return ratings.sort_values(["user_id", "movie_id"], ignore_index=True)
+
+
+def generate(args: argparse.Namespace) -> None:
+    rng = np.random.default_rng(args.seed)
+    n_users = args.users or max(100, args.ratings // 150)
+    n_movies = args.movies or min(62_000, max(50, args.ratings // 250))
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+
+    movies = generate_movies(n_movies, rng)
+    ratings = generate_ratings(args.ratings, n_users, n_movies, rng)
+    movies.to_csv(out / "movies.csv", index=False)
+    ratings.to_csv(out / "ratings.csv", index=False)
+    print(f"Wrote {len(movies)} movies and {len(ratings)} ratings from {ratings['user_id'].nunique()} users to {out}")
+
+
+def measure(func, repeat: int = 1) -> dict:
+    """Wall time of ``func`` over ``repeat`` untraced runs, plus its peak traced allocation."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "runs": repeat,
+        "mean_ms": 1000 * float(np.mean(timings)),
+        "p95_ms": 1000 * float(np.percentile(timings, 95)),
+        "peak_mib": peak / 2**20,
+    }
+
+
+def bench_recommend(args: argparse.Namespace) -> None:
+    data = Path(args.data)
+    movies_path, ratings_path = data / "movies.csv", data / "ratings.csv"
+    recommender = SmartRecommender(
+        str(movies_path), str(ratings_path), neighbor_k=args.k or None, neighbor_mode=args.mode, content_k=args.content_k or None
+    )
+    user_ids = recommender.user_items.user_ids.to_numpy()
+    rng = np.random.default_rng(args.seed)
+    sample = rng.choice(user_ids, size=min(args.sample, len(user_ids)), replace=False).tolist()
+    print(f"ratings={len(recommender.seed_ratings)} users={len(user_ids)} movies={len(recommender.movies_df)} sample={len(sample)}")
+
+    stages = {
+        "build_catalog": measure(lambda: build_catalog(movies_path)),
+        "read_ratings": measure(lambda: RatingsStore.read_csv(ratings_path)),
+        "bulk_load": measure(recommender.bulk_load),
+    }
+
+    # Per-user stages, each over the same sample; the merge reuses precomputed inputs.
+    inputs = {}
+    for user_id in sample:
+        ratings = recommender.user_items.ratings_for(user_id)
+        inputs[user_id] = (
+            ratings,
+            recommender._content_scores(list(ratings), list(ratings.values())),
+            recommender._collab_scores(user_id),
+        )
+    per_user = {
+        "content_scores": lambda user_id: recommender._content_scores(list(inputs[user_id][0]), list(inputs[user_id][0].values())),
+        "collab_scores": lambda user_id: recommender._collab_scores(user_id),
+        "merge_sort": lambda user_id: recommender._merge_scores(inputs[user_id][1], inputs[user_id][2], set(inputs[user_id][0]), args.top_n),
+        "recommend": lambda user_id: recommender.recommend(user_id, args.top_n),
+    }
+    for name, func in per_user.items():
+        results = [measure(lambda: func(user_id)) for user_id in sample]
+        stages[name] = {
+            "runs": len(results),
+            "mean_ms": float(np.mean([r["mean_ms"] for r in results])),
+            "p95_ms": float(np.percentile([r["mean_ms"] for r in results], 95)),
+            "peak_mib": float(max(r["peak_mib"] for r in results)),
+        }
+
+    for name, stats in stages.items():
+        print(f"{name:>15}: mean {stats['mean_ms']:10.3f} ms  p95 {stats['p95_ms']:10.3f} ms  peak {stats['peak_mib']:8.2f} MiB")
+
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "data": str(data),
+        "ratings": int(len(recommender.seed_ratings)),
+        "users": int(len(user_ids)),
+        "movies": int(len(recommender.movies_df)),
+        "neighbor_k": args.k,
+        "neighbor_mode": args.mode,
+        "content_k": args.content_k,
+        "top_n": args.top_n,
+        "stages": stages,
+        "max_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    if args.out:
+        out = Path(args.out)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(report, indent=2))
+        print(f"Wrote {out}")
+
+
+def holdout_split(ratings: pd.DataFrame, users: list[int], fraction: float, rng: np.random.Generator) -> tuple:
+    """Move a random ``fraction`` of each listed user's ratings into a test set."""
+    candidates = ratings[ratings["user_id"].isin(users)]
+    test = candidates.groupby("user_id", group_keys=False).sample(frac=fraction, random_state=rng)
+    return ratings.drop(test.index), test
+
+
+def bench_backends(args: argparse.Namespace) -> None:
+    data = Path(args.data)
+    ratings = load_ratings(str(data / "ratings.csv"))
+    rng = np.random.default_rng(args.seed)
+    counts = ratings["user_id"].value_counts()
+    eligible = counts[counts >= args.min_ratings].index.to_numpy()
+    users = rng.choice(eligible, size=min(args.sample, len(eligible)), replace=False).tolist()
+    train, test = holdout_split(ratings, users, args.holdout, rng)
+    relevant = test[test["rating"] >= args.relevant].groupby("user_id")["movie_id"].agg(set).to_dict()
+    print(f"ratings={len(ratings)} train={len(train)} test={len(test)} users evaluated={len(relevant)} k={args.k}")
+
+    als_params = {
+        "factors": args.als_factors,
+        "regularization": args.als_regularization,
+        "alpha": args.als_alpha,
+        "iterations": args.als_iterations,
+    }
+    report = {"commit": _git_commit(), "data": str(data), "k": args.k, "als_params": als_params, "backends": {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        train_path = Path(workdir) / "ratings.csv"
+        train.to_csv(train_path, index=False)
+        for backend in COLLAB_BACKENDS:
+            started = time.perf_counter()
+            recommender = SmartRecommender(
+                str(data / "movies.csv"), str(train_path), backend=backend, als_params=als_params
+            )
+            build = time.perf_counter() - started
+
+            timings, precisions = [], []
+            for user_id, truth in relevant.items():
+                started = time.perf_counter()
+                recs = recommender.recommend(user_id, args.k)
+                timings.append(time.perf_counter() - started)
+                precisions.append(len(truth & set(recs["movie_id"].tolist())) / args.k)
+            stats = {
+                "build_s": build,
+                "mean_ms": 1000 * float(np.mean(timings)),
+                "p95_ms": 1000 * float(np.percentile(timings, 95)),
+                f"precision@{args.k}": float(np.mean(precisions)),
+            }
+            report["backends"][backend] = stats
+            print(
+                f"{backend:>12}: build {build:7.2f}s  recommend mean {stats['mean_ms']:8.3f} ms  "
+                f"p95 {stats['p95_ms']:8.3f} ms  precision@{args.k} {stats[f'precision@{args.k}']:.4f}"
+            )
+
+    if args.out:
+        out = Path(args.out)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(report, indent=2))
+        print(f"Wrote {out}")
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    neighbors = commands.add_parser("neighbors", help="recall@K and latency of the neighbor index vs brute force")
+    neighbors.add_argument("--ratings", default="data/ratings.csv")
+    neighbors.add_argument("--k", type=int, default=50)
+    neighbors.add_argument("--tables", type=int, default=16)
+    neighbors.add_argument("--bits", type=int, default=4)
+    neighbors.add_argument("--sample", type=int, default=500, help="users to evaluate")
+    neighbors.add_argument("--seed", type=int, default=0)
+    neighbors.set_defaults(func=bench_neighbors)
+
+    gen = commands.add_parser("generate", help="write a synthetic MovieLens-shaped movies.csv/ratings.csv")
+    gen.add_argument("--ratings", type=count, default=count("100k"), help="e.g. 10k, 100k, 1m, 10m")
+    gen.add_argument("--users", type=count, default=None, help="default: ratings / 150")
+    gen.add_argument("--movies", type=count, default=None, help="default: ratings / 250, at most 62k")
+    gen.add_argument("--out", default="data/synthetic")
+    gen.add_argument("--seed", type=int, default=0)
+    gen.set_defaults(func=generate)
+
+    recommend = commands.add_parser("recommend", help="per-stage wall time and peak memory of SmartRecommender")
+    recommend.add_argument("--data", default="data", help="directory holding movies.csv and ratings.csv")
+    recommend.add_argument("--k", type=int, default=0, help="neighbor index size (0: score against all users)")
+    recommend.add_argument("--mode", default="exact", choices=["exact", "lsh"])
+    recommend.add_argument("--content-k", type=int, default=0, help="item neighbor table size (0: score the whole catalog)")
+    recommend.add_argument("--top-n", type=int, default=12)
+    recommend.add_argument("--sample", type=int, default=50, help="users to evaluate")
+    recommend.add_argument("--seed", type=int, default=0)
+    recommend.add_argument("--out", default=None, help="write the results as JSON")
+    recommend.set_defaults(func=bench_recommend)
+
+    backends = commands.add_parser("backends", help="latency and precision@k of each collaborative backend")
+    backends.add_argument("--data", default="data", help="directory holding movies.csv and ratings.csv")
+    backends.add_argument("--k", type=int, default=10)
+    backends.add_argument("--holdout", type=float, default=0.2, help="share of each evaluated user's ratings held out")
+    backends.add_argument("--relevant", type=float, default=4.0, help="held-out ratings at or above this count as hits")
+    backends.add_argument("--min-ratings", type=int, default=10, help="only evaluate users with this many ratings")
+    backends.add_argument("--sample", type=int, default=200, help="users to evaluate")
+    backends.add_argument("--seed", type=int, default=0)
+    backends.add_argument("--als-factors", type=int, default=32)
+    backends.add_argument("--als-regularization", type=float, default=10.0)
+    backends.add_argument("--als-alpha", type=float, default=0.5)
+    backends.add_argument("--als-iterations", type=int, default=10)
+    backends.add_argument("--out", default=None, help="write the results as JSON")
+    backends.set_defaults(func=bench_backends)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
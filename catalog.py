@@ -0,0 +1,266 @@
+"""Precompiled movie catalog artifact for SmartRecs.
+
+Parsing ``movies.csv``, normalizing titles and fitting TF-IDF on genres is done
+once and written to a compact ``.npz`` next to the CSV. Workers load that
+artifact instead of refitting; under ``gunicorn --preload`` it is loaded once in
+the master and shared copy-on-write by every worker.
+
+Build it ahead of time with:
+    python catalog.py
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+ARTIFACT_VERSION = 1
+MOVIES_PATH = Path("data/movies.csv")
+
+# Release years of catalog titles that carry none in the title; others fall back to DEFAULT_YEAR.
+YEAR_MAP = {
+    "inception": "2010",
+    "interstellar": "2014",
+    "the matrix": "1999",
+    "the dark knight": "2008",
+    "arrival": "2016",
+    "avatar": "2009",
+    "the prestige": "2006",
+    "blade runner 2049": "2017",
+    "guardians of the galaxy": "2014",
+    "shutter island": "2010",
+    "mad max: fury road": "2015",
+    "the shawshank redemption": "1994",
+    "pulp fiction": "1994",
+    "the godfather": "1972",
+    "whiplash": "2014",
+    "the lord of the rings: the fellowship of the ring": "2001",
+    "the social network": "2010",
+    "parasite": "2019",
+    "dune": "2021",
+    "spider-man: into the spider-verse": "2018",
+    "the grand budapest hotel": "2014",
+    "her": "2013",
+    "la la land": "2016",
+    "the lion king": "1994",
+    "gladiator": "2000",
+    "the silence of the lambs": "1991",
+    "toy story": "1995",
+    "se7en": "1995",
+    "the truman show": "1998",
+    "the departed": "2006",
+    "black panther": "2018",
+    "coco": "2017",
+    "ford v ferrari": "2019",
+    "knives out": "2019",
+    "the martian": "2015",
+    "no country for old men": "2007",
+    "the imitation game": "2014",
+    "inside out": "2015",
+    "a quiet place": "2018",
+    "everything everywhere all at once": "2022",
+    "superman": "2025",
+    "the fantastic four: first steps": "2025",
+    "jurassic world rebirth": "2025",
+    "mission: impossible - the final reckoning": "2025",
+    "tron: ares": "2025",
+    "m3gan 2.0": "2025",
+    "how to train your dragon": "2025",
+}
+DEFAULT_YEAR = "2000"
+
+
+class Catalog:
+    """Catalog rows plus the fitted genre TF-IDF model."""
+
+    def __init__(self, movies_df: pd.DataFrame, genre_matrix: sparse.csr_matrix, tfidf: TfidfVectorizer) -> None:
+        self.movies_df = movies_df
+        self.genre_matrix = genre_matrix
+        self.tfidf = tfidf
+
+
+def artifact_path_for(movies_path: str | Path) -> Path:
+    return Path(movies_path).with_name("catalog.npz")
+
+
+def build_catalog(movies_path: str | Path = MOVIES_PATH, previous: Catalog | None = None) -> Catalog:
+    """Parse the CSV, derive normalized title/year columns and fit TF-IDF on genres.
+
+    When the CSV only appends movies to ``previous`` (see :func:`extend_catalog`)
+    its fitted TF-IDF is reused instead of refitting.
+    """
+    movies_df = normalize_titles(pd.read_csv(movies_path))
+    if previous is not None:
+        extended = extend_catalog(previous, movies_df)
+        if extended is not None:
+            return extended
+
+    tfidf = TfidfVectorizer()
+    genre_matrix = tfidf.fit_transform(movies_df["genre_text"]).tocsr()
+    return Catalog(movies_df, genre_matrix, tfidf)
+
+
+def extend_catalog(previous: Catalog, movies_df: pd.DataFrame) -> Catalog | None:
+    """``movies_df`` as an extension of ``previous``, its new rows transformed by ``previous``'s TF-IDF.
+
+    Keeping the vocabulary and IDF leaves every existing genre vector unchanged, so
+    the item neighbor table built on them is extended rather than rebuilt. ``None``
+    unless ``movies_df`` (normalized) starts with ``previous``'s movies and the
+    appended ones only use known genre terms; a refit would be needed otherwise.
+    """
+    known = len(previous.movies_df)
+    if not 0 < known <= len(movies_df):
+        return None
+    key = ["movie_id", "title", "genres"]
+    head = movies_df[key].head(known).astype(str).reset_index(drop=True)
+    if not previous.movies_df[key].astype(str).reset_index(drop=True).equals(head):
+        return None
+    appended = movies_df["genre_text"].iloc[known:].fillna("")
+    vocabulary = set(previous.tfidf.get_feature_names_out().tolist())
+    analyzer = previous.tfidf.build_analyzer()
+    if any(term not in vocabulary for text in appended for term in analyzer(text)):
+        return None
+    genre_matrix = sparse.vstack([previous.genre_matrix, previous.tfidf.transform(appended)], format="csr")
+    return Catalog(movies_df, genre_matrix, previous.tfidf)
+
+
+def normalize_titles(movies_df: pd.DataFrame) -> pd.DataFrame:
+    """Add ``genre_text``, ``clean_title``, ``lower_title``, ``title_year`` and ``year`` columns in place.
+
+    ``year`` is the one shown and filtered on: the title's year, else ``YEAR_MAP``,
+    else ``DEFAULT_YEAR``.
+    """
+    # Normalize genre text to a space-delimited form so TF-IDF can tokenize it.
+    movies_df["genre_text"] = movies_df["genres"].str.replace("|", " ", regex=False)
+    titles = movies_df["title"].astype(str)
+    movies_df["clean_title"] = titles.str.replace(r"\s*\(\d{4}\)\s*$", "", regex=True).str.strip()
+    movies_df["lower_title"] = movies_df["clean_title"].str.lower()
+    movies_df["title_year"] = titles.str.extract(r"\((\d{4})\)\s*$", expand=False).fillna("")
+    movies_df["year"] = resolve_years(movies_df)
+    return movies_df
+
+
+def resolve_years(movies_df: pd.DataFrame) -> pd.Series:
+    """The display year of every row, from ``title_year`` and ``lower_title``."""
+    looked_up = movies_df["lower_title"].map(YEAR_MAP).fillna(DEFAULT_YEAR)
+    return movies_df["title_year"].mask(movies_df["title_year"] == "", looked_up)
+
+
+def save_catalog(catalog: Catalog, artifact_path: str | Path, fingerprint: str = "", best_effort: bool = False) -> None:
+    """Write the artifact with :func:`write_npz`."""
+    vocabulary = catalog.tfidf.get_feature_names_out()
+    arrays = {
+        "version": np.array(ARTIFACT_VERSION),
+        "fingerprint": np.array(fingerprint),
+        "columns": np.array(catalog.movies_df.columns.tolist()),
+        "genre_data": catalog.genre_matrix.data,
+        "genre_indices": catalog.genre_matrix.indices,
+        "genre_indptr": catalog.genre_matrix.indptr,
+        "genre_shape": np.array(catalog.genre_matrix.shape),
+        "vocabulary": vocabulary.astype(str),
+        "idf": catalog.tfidf.idf_,
+    }
+    for column in catalog.movies_df.columns:
+        values = catalog.movies_df[column]
+        arrays[f"col_{column}"] = values.to_numpy() if values.dtype != object else values.astype(str).to_numpy(dtype=str)
+
+    write_npz(artifact_path, arrays, best_effort)
+
+
+def write_npz(path: str | Path, arrays: dict[str, np.ndarray], best_effort: bool = False) -> bool:
+    """Write ``arrays`` to ``path`` atomically, so concurrent workers never read a partial file.
+
+    With ``best_effort`` an unwritable location (a read-only deploy) is not an
+    error: the caller keeps its in-memory build. Returns whether the file was written.
+    """
+    path = Path(path)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=path.parent, suffix=".npz.tmp")
+    except OSError:
+        if best_effort:
+            return False
+        raise
+    try:
+        with os.fdopen(handle, "wb") as stream:
+            np.savez(stream, **arrays)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException as error:
+        Path(temp_path).unlink(missing_ok=True)
+        if best_effort and isinstance(error, OSError):
+            return False
+        raise
+    return True
+
+
+def read_catalog(artifact_path: str | Path, fingerprint: str | None = None) -> Catalog | None:
+    """Load an artifact; ``None`` if it is missing, outdated or built from another CSV."""
+    try:
+        with np.load(artifact_path) as data:
+            if int(data["version"]) != ARTIFACT_VERSION:
+                return None
+            if fingerprint is not None and str(data["fingerprint"]) != fingerprint:
+                return None
+            movies_df = pd.DataFrame({column: data[f"col_{column}"] for column in data["columns"].tolist()})
+            genre_matrix = sparse.csr_matrix(
+                (data["genre_data"], data["genre_indices"], data["genre_indptr"]), shape=tuple(data["genre_shape"])
+            )
+            vocabulary = data["vocabulary"].tolist()
+            idf = data["idf"]
+    except (OSError, KeyError, ValueError):
+        return None
+
+    for column in movies_df.columns:
+        if movies_df[column].dtype.kind == "U":
+            movies_df[column] = movies_df[column].astype(object)
+    if "year" not in movies_df:
+        # Written before normalize_titles resolved years.
+        movies_df["year"] = resolve_years(movies_df)
+    tfidf = TfidfVectorizer(vocabulary={term: index for index, term in enumerate(vocabulary)})
+    tfidf.idf_ = idf
+    return Catalog(movies_df, genre_matrix, tfidf)
+
+
+def load_catalog(movies_path: str | Path = MOVIES_PATH, artifact_path: str | Path | None = None) -> Catalog:
+    """Return the catalog for ``movies_path``, from its artifact when it is up to date.
+
+    A missing or stale artifact is rebuilt from the CSV, extending the stale one
+    when movies were only appended, and written back (best effort). ``python
+    catalog.py`` always refits.
+    """
+    artifact_path = artifact_path or artifact_path_for(movies_path)
+    fingerprint = _fingerprint(movies_path)
+    catalog = read_catalog(artifact_path, fingerprint)
+    if catalog is not None:
+        return catalog
+    catalog = build_catalog(movies_path, previous=read_catalog(artifact_path))
+    save_catalog(catalog, artifact_path, fingerprint, best_effort=True)
+    return catalog
+
+
+def _fingerprint(movies_path: str | Path) -> str:
+    return hashlib.sha256(Path(movies_path).read_bytes()).hexdigest()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the precompiled catalog artifact.")
+    parser.add_argument("--movies", default=str(MOVIES_PATH))
+    parser.add_argument("--out", default=None, help="artifact path (default: catalog.npz next to the CSV)")
+    args = parser.parse_args()
+
+    out = Path(args.out) if args.out else artifact_path_for(args.movies)
+    catalog = build_catalog(args.movies)
+    save_catalog(catalog, out, _fingerprint(args.movies))
+    print(f"Wrote {len(catalog.movies_df)} movies, {catalog.genre_matrix.shape[1]} genre terms to {out}")
+
+
+if __name__ == "__main__":
+    main()
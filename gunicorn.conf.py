@@ -0,0 +1,15 @@
+"""Gunicorn settings for SmartRecs, read automatically from the working directory.
+
+The command line in Procfile / railway.toml sets the bind address, workers and
+``--preload``; this file only adds the hook below.
+"""
+
+
+def on_starting(server):
+    # With --preload the app is already imported in the master at this point.
+    # Build its lazily loaded catalog state now, so the forked workers share it
+    # copy-on-write instead of each building a private copy on first request.
+    if server.cfg.preload_app:
+        import app
+
+        app.catalog_details()
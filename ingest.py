@@ -0,0 +1,162 @@
+"""Bulk rating import for SmartRecs.
+
+Streams a ratings CSV (``user_id,movie_id,rating``) in chunks, validates every
+chunk with vectorized checks and upserts the valid rows with ``executemany``,
+one transaction per chunk, instead of one committed statement per rating.
+A (user, movie) pair listed more than once is written once, with its last
+valid rating, even across chunks: a first pass over the file finds those rows.
+Importing the same file again leaves the database as it was: unchanged ratings
+are not rewritten, so their versions and cached recommendations stay valid.
+
+    flask --app app import-ratings ratings.csv
+"""
+from __future__ import annotations
+
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Callable, Iterator
+
+import numpy as np
+import pandas as pd
+
+from models import deferred_rating_maintenance, upsert_ratings
+
+CHUNK_ROWS = 200_000
+MIN_RATING, MAX_RATING = 1.0, 5.0
+
+
+class ImportReport:
+    """Row counts and throughput of one import."""
+
+    def __init__(self) -> None:
+        self.rows_read = 0
+        self.rows_valid = 0
+        self.rows_written = 0
+        self.rejected: dict[str, int] = {}
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows_read / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        rejected = ", ".join(f"{reason}: {count}" for reason, count in sorted(self.rejected.items())) or "none"
+        return (
+            f"Read {self.rows_read} rows in {self.seconds:.1f}s ({self.rows_per_second:,.0f} rows/s); "
+            f"{self.rows_written} of {self.rows_valid} valid rows inserted or changed; rejected {rejected}."
+        )
+
+
+def read_chunks(path: str | Path, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """The CSV's id and rating columns as raw strings, ``chunk_rows`` rows at a time."""
+    return pd.read_csv(
+        path,
+        usecols=["user_id", "movie_id", "rating"],
+        dtype=str,
+        keep_default_na=False,
+        chunksize=chunk_rows,
+    )
+
+
+def validate_chunk(chunk: pd.DataFrame, movie_ids: np.ndarray | None = None) -> tuple[pd.DataFrame, dict[str, int]]:
+    """Split ``chunk`` into typed valid rows and rejected-row counts per reason.
+
+    Rows need positive integer ids and a rating the ``user_ratings`` CHECK accepts;
+    with ``movie_ids`` the movie must also be in the catalog. A (user, movie) pair
+    repeated within the chunk keeps its last row, as sequential upserts would.
+    Valid rows keep their ``chunk`` index (their row number in the file).
+    """
+    user_ids = pd.to_numeric(chunk["user_id"].str.strip(), errors="coerce").to_numpy(dtype=np.float64)
+    movies = pd.to_numeric(chunk["movie_id"].str.strip(), errors="coerce").to_numpy(dtype=np.float64)
+    ratings = pd.to_numeric(chunk["rating"].str.strip(), errors="coerce").to_numpy(dtype=np.float64)
+
+    checks = {
+        "malformed": np.isnan(user_ids) | np.isnan(movies) | np.isnan(ratings),
+        "bad_id": (user_ids % 1 != 0) | (movies % 1 != 0) | (user_ids < 1) | (movies < 1),
+        "rating_out_of_range": (ratings < MIN_RATING) | (ratings > MAX_RATING),
+    }
+    if movie_ids is not None:
+        checks["unknown_movie"] = ~np.isin(movies, movie_ids)
+
+    # Each rejected row is counted once, under the first check it fails.
+    rejected_mask = np.zeros(len(chunk), dtype=bool)
+    rejected: dict[str, int] = {}
+    for reason, failed in checks.items():
+        failed = failed & ~rejected_mask
+        if failed.any():
+            rejected[reason] = int(failed.sum())
+            rejected_mask |= failed
+
+    keep = ~rejected_mask
+    valid = pd.DataFrame(
+        {"user_id": user_ids[keep].astype(np.int64), "movie_id": movies[keep].astype(np.int64), "rating": ratings[keep]},
+        index=chunk.index[keep],
+    )
+    return valid.drop_duplicates(["user_id", "movie_id"], keep="last"), rejected
+
+
+def last_rows(path: str | Path, movie_ids: np.ndarray | None = None, chunk_rows: int = CHUNK_ROWS) -> np.ndarray:
+    """Sorted row numbers of the last valid row of every (user, movie) pair in the CSV.
+
+    Keeps three int64 columns (user, movie, row) per valid row and deduplicates
+    them once at the end, so the pass stays linear in the file's length.
+    """
+    users, movies, rows = [], [], []
+    for chunk in read_chunks(path, chunk_rows):
+        valid, _ = validate_chunk(chunk, movie_ids)
+        users.append(valid["user_id"].to_numpy(dtype=np.int64))
+        movies.append(valid["movie_id"].to_numpy(dtype=np.int64))
+        rows.append(valid.index.to_numpy(dtype=np.int64))
+    if not rows:
+        return np.empty(0, dtype=np.int64)
+    users, movies, rows = np.concatenate(users), np.concatenate(movies), np.concatenate(rows)
+    # lexsort is stable and rows arrive in file order, so each pair's last row ends its run.
+    order = np.lexsort((movies, users))
+    users, movies = users[order], movies[order]
+    last = np.ones(len(order), dtype=bool)
+    last[:-1] = (users[1:] != users[:-1]) | (movies[1:] != movies[:-1])
+    return np.sort(rows[order[last]])
+
+
+def is_kept(rows: np.ndarray, keep: np.ndarray) -> np.ndarray:
+    """Mask of the ``rows`` found in the sorted ``keep`` row numbers."""
+    positions = np.searchsorted(keep, rows)
+    found = positions < len(keep)
+    found[found] = keep[positions[found]] == rows[found]
+    return found
+
+
+def import_ratings(
+    path: str | Path,
+    movie_ids: np.ndarray | None = None,
+    chunk_rows: int = CHUNK_ROWS,
+    defer_triggers: bool = False,
+    progress: Callable[[ImportReport], None] | None = None,
+) -> ImportReport:
+    """Import a ratings CSV into ``user_ratings``; see the module docstring.
+
+    With ``defer_triggers`` the whole import runs in one transaction with the
+    table's triggers dropped and their work (rating versions, dashboard
+    aggregates) redone once for the touched users at the end
+    (:func:`models.deferred_rating_maintenance`): faster for large loads, but
+    other writers wait until it finishes. ``progress`` is called after each chunk.
+    """
+    report = ImportReport()
+    started = time.perf_counter()
+    keep = last_rows(path, movie_ids, chunk_rows)
+    with deferred_rating_maintenance() if defer_triggers else nullcontext():
+        for chunk in read_chunks(path, chunk_rows):
+            valid, rejected = validate_chunk(chunk, movie_ids)
+            # Earlier rows of a pair repeated in a later chunk: only its last row is written.
+            valid = valid[is_kept(valid.index.to_numpy(dtype=np.int64), keep)]
+            report.rows_read += len(chunk)
+            report.rows_valid += len(valid)
+            for reason, count in rejected.items():
+                report.rejected[reason] = report.rejected.get(reason, 0) + count
+            report.rows_written += upsert_ratings(zip(*(valid[column].tolist() for column in valid.columns)))
+            report.seconds = time.perf_counter() - started
+            if progress is not None:
+                progress(report)
+    report.seconds = time.perf_counter() - started
+    return report
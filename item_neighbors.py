@@ -0,0 +1,235 @@
+"""Top-K item-item similarity table for content scoring on large catalogs.
+
+Every movie keeps its ``k`` most similar other movies (cosine over the
+L2-normalized genre TF-IDF rows), computed block by block with sparse products
+so the full movie x movie matrix never exists. A user's content scores are then
+accumulated over the neighbor lists of the movies they rated: O(ratings x k)
+however large the catalog is.
+
+Ties are broken by catalog position, which makes a table extended with new
+movies identical to one rebuilt from scratch.
+
+Build it ahead of time (it is otherwise built on first use) with:
+    python item_neighbors.py --k 50
+"""
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+from catalog import MOVIES_PATH, artifact_path_for, load_catalog, write_npz
+
+TABLE_VERSION = 1
+
+
+class ItemNeighborTable:
+    """``positions[i]`` / ``sims[i]``: the ``k`` movies most similar to catalog row ``i``.
+
+    Rows are ordered by descending similarity; slots without a (non-zero)
+    neighbor hold position ``-1`` and similarity ``0``.
+    """
+
+    def __init__(self, vectors: sparse.csr_matrix, k: int = 50, block_size: int = 256) -> None:
+        self.vectors = vectors
+        self.k = k
+        self.block_size = block_size
+        self.positions = np.full((0, k), -1, dtype=np.int32)
+        self.sims = np.zeros((0, k))
+        self._matrix: sparse.csr_matrix | None = None
+
+    @classmethod
+    def build(cls, vectors: sparse.csr_matrix, k: int = 50, block_size: int = 256) -> ItemNeighborTable:
+        table = cls(vectors[:0], k, block_size)
+        return table.extend(vectors)
+
+    def extend(self, vectors: sparse.csr_matrix) -> ItemNeighborTable:
+        """Add the rows of ``vectors`` beyond the ones already indexed; returns ``self``.
+
+        The existing rows must be unchanged. New movies get full neighbor lists and
+        existing lists are merged with their similarities to the new movies only.
+        Similarities are computed once per distinct vector (genre combinations
+        repeat across thousands of movies), then shared by every movie holding it.
+        """
+        known = self.vectors.shape[0]
+        total = vectors.shape[0]
+        if total < known:
+            raise ValueError("vectors must extend the indexed rows")
+        if total == known:
+            return self
+        vectors = vectors.tocsr()
+        codes, representatives = _distinct_rows(vectors)
+
+        # Existing rows: merge current lists with the top new movies for their vector.
+        if known:
+            old_codes = np.unique(codes[:known])
+            positions, sims = self._candidates(vectors, representatives, old_codes, vectors[known:], known, self.k)
+            self.positions, self.sims = self._merge(self.positions, self.sims, positions[codes[:known]], sims[codes[:known]])
+
+        # New rows: full lists against every movie. One extra candidate per vector
+        # leaves room to drop the movie itself.
+        new_codes = np.unique(codes[known:])
+        positions, sims = self._candidates(vectors, representatives, new_codes, vectors, 0, self.k + 1)
+        rows = np.arange(known, total)
+        positions, sims = positions[codes[known:]], sims[codes[known:]]
+        keep = positions != rows[:, None]
+        keep[keep.all(axis=1), self.k] = False
+        self.positions = np.vstack([self.positions, positions[keep].reshape(-1, self.k)])
+        self.sims = np.vstack([self.sims, sims[keep].reshape(-1, self.k)])
+        self.vectors = vectors
+        self._matrix = None
+        return self
+
+    def _candidates(self, vectors, representatives, codes, columns, offset: int, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Top ``k`` of ``columns`` for each distinct vector in ``codes``, as arrays indexed by code."""
+        positions = np.full((len(representatives), k), -1, dtype=np.int32)
+        sims = np.zeros((len(representatives), k))
+        columns_t = columns.T.tocsc()
+        for start in range(0, len(codes), self.block_size):
+            block = codes[start : start + self.block_size]
+            block_sims = (vectors[representatives[block]] @ columns_t).toarray()
+            positions[block], sims[block] = self._top_k(block_sims, offset, k)
+        return positions, sims
+
+    def _top_k(self, sims: np.ndarray, offset: int, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Per row of ``sims`` (columns are positions from ``offset``), the top ``k`` non-zero entries."""
+        rows, width = sims.shape
+        positions = np.full((rows, k), -1, dtype=np.int32)
+        values = np.zeros((rows, k))
+        if width > k:
+            thresholds = np.partition(sims, width - k, axis=1)[:, width - k]
+        else:
+            thresholds = np.zeros(rows)
+        for row in range(rows):
+            values_row = sims[row]
+            threshold = max(thresholds[row], 0.0)
+            above = np.flatnonzero(values_row > threshold)
+            # Ties at the threshold go to the lowest catalog positions.
+            ties = np.flatnonzero(values_row == threshold)[: k - len(above)] if threshold > 0 else ()
+            chosen = np.concatenate([above, ties]).astype(np.int64)
+            chosen = chosen[np.lexsort((chosen, -values_row[chosen]))]
+            positions[row, : len(chosen)] = chosen + offset
+            values[row, : len(chosen)] = values_row[chosen]
+        return positions, values
+
+    def _merge(self, positions_a, sims_a, positions_b, sims_b) -> tuple[np.ndarray, np.ndarray]:
+        positions = np.hstack([positions_a, positions_b])
+        sims = np.hstack([sims_a, sims_b])
+        # Empty slots (-1) sort last; then by descending similarity and ascending position.
+        empty = positions < 0
+        order = np.lexsort((np.where(empty, np.iinfo(np.int32).max, positions), -sims, empty), axis=1)[:, : self.k]
+        return np.take_along_axis(positions, order, axis=1), np.take_along_axis(sims, order, axis=1)
+
+    @property
+    def matrix(self) -> sparse.csr_matrix:
+        """The table as a sparse movie x movie similarity matrix (``k`` entries per row)."""
+        if self._matrix is None:
+            filled = self.positions >= 0
+            counts = filled.sum(axis=1)
+            indptr = np.zeros(len(self.positions) + 1, dtype=np.int64)
+            np.cumsum(counts, out=indptr[1:])
+            self._matrix = sparse.csr_matrix(
+                (self.sims[filled], self.positions[filled], indptr), shape=(len(self.positions), len(self.positions))
+            )
+        return self._matrix
+
+    def scores(self, movie_weights: sparse.csr_matrix) -> np.ndarray:
+        """``movie_weights`` (users x movies) accumulated over the neighbor lists, densely."""
+        return np.asarray((movie_weights @ self.matrix).todense())
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        return {
+            "version": np.array(TABLE_VERSION),
+            "k": np.array(self.k),
+            "positions": self.positions,
+            "sims": self.sims,
+            "vector_data": self.vectors.data,
+            "vector_indices": self.vectors.indices,
+            "vector_indptr": self.vectors.indptr,
+            "vector_shape": np.array(self.vectors.shape),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, block_size: int = 256) -> ItemNeighborTable:
+        vectors = sparse.csr_matrix(
+            (arrays["vector_data"], arrays["vector_indices"], arrays["vector_indptr"]), shape=tuple(arrays["vector_shape"])
+        )
+        table = cls(vectors, int(arrays["k"]), block_size)
+        table.positions = np.asarray(arrays["positions"])
+        table.sims = np.asarray(arrays["sims"])
+        return table
+
+    def save(self, path: str | Path, best_effort: bool = False) -> None:
+        """Write the table with :func:`catalog.write_npz`."""
+        write_npz(path, self.arrays(), best_effort)
+
+    @classmethod
+    def load_or_build(cls, path: str | Path, vectors: sparse.csr_matrix, k: int) -> ItemNeighborTable:
+        """The table for ``vectors``, from ``path`` when possible.
+
+        A saved table built on a prefix of ``vectors`` (movies appended since) is
+        extended; a missing one, or one built on different vectors or another
+        ``k``, is rebuilt. Changes are written back (best effort). Movies appended
+        to the catalog keep its fitted TF-IDF (:func:`catalog.extend_catalog`), so
+        the vectors of the existing ones, and the table built on them, stay valid.
+        """
+        table = None
+        try:
+            with np.load(path) as data:
+                if int(data["version"]) == TABLE_VERSION and int(data["k"]) == k:
+                    table = cls.from_arrays(data)
+        except (OSError, KeyError, ValueError):
+            pass
+        if table is not None and not _is_prefix(table.vectors, vectors):
+            table = None
+
+        if table is not None and table.vectors.shape[0] == vectors.shape[0]:
+            return table
+        table = table.extend(vectors) if table is not None else cls.build(vectors, k)
+        table.save(path, best_effort=True)
+        return table
+
+
+def table_path_for(movies_path: str | Path) -> Path:
+    return artifact_path_for(movies_path).with_name("item_neighbors.npz")
+
+
+def _distinct_rows(vectors: sparse.csr_matrix) -> tuple[np.ndarray, np.ndarray]:
+    """``(codes, representatives)``: a distinct-vector code per row and the first row holding each code."""
+    indptr, indices, data = vectors.indptr, vectors.indices, vectors.data
+    keys = [indices[start:end].tobytes() + data[start:end].tobytes() for start, end in zip(indptr[:-1], indptr[1:])]
+    codes, _ = pd.factorize(pd.Index(keys, dtype=object))
+    _, representatives = np.unique(codes, return_index=True)
+    return codes, representatives
+
+
+def _is_prefix(prefix: sparse.csr_matrix, vectors: sparse.csr_matrix) -> bool:
+    rows = prefix.shape[0]
+    if rows > vectors.shape[0] or prefix.shape[1] != vectors.shape[1]:
+        return False
+    head = vectors[:rows]
+    return (
+        np.array_equal(prefix.indptr, head.indptr)
+        and np.array_equal(prefix.indices, head.indices)
+        and np.array_equal(prefix.data, head.data)
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build (or extend) the item-item neighbor table.")
+    parser.add_argument("--movies", default=str(MOVIES_PATH))
+    parser.add_argument("--k", type=int, default=50, help="neighbors kept per movie")
+    args = parser.parse_args()
+
+    out = table_path_for(args.movies)
+    vectors = normalize(load_catalog(args.movies).genre_matrix)
+    table = ItemNeighborTable.load_or_build(out, vectors, args.k)
+    print(f"Wrote top-{table.k} neighbors for {len(table.positions)} movies to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""In-process metrics for SmartRecs, exposed in Prometheus text format.
+
+A deliberately small registry (counters, gauges and histograms with labels)
+so the app needs no extra dependency. Values are per process: under gunicorn
+every worker keeps and serves its own.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Iterable, Iterator
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Collect = Callable[[], dict[tuple[str, ...], float]]
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._collectors: list[Collect] = []
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def collector(self, collect: Collect) -> Collect:
+        """Register a callback whose ``{labelvalues: value}`` is added to the series at scrape time.
+
+        For values kept elsewhere, such as ``lru_cache`` statistics or table sizes.
+        """
+        self._collectors.append(collect)
+        return collect
+
+    def samples(self) -> Iterator[tuple[str, tuple[str, ...], tuple[str, ...], float]]:
+        """``(suffix, labelnames, labelvalues, value)`` for every series."""
+        with self._lock:
+            values = dict(self._values)
+        for collect in self._collectors:
+            for key, value in collect().items():
+                values[key] = values.get(key, 0.0) + value
+        for key, value in sorted(values.items()):
+            yield "", self.labelnames, key, value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: tuple = LATENCY_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> Iterator[tuple[str, tuple[str, ...], tuple[str, ...], float]]:
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+        bucket_labels = self.labelnames + ("le",)
+        for key, (counts, total) in sorted(series.items()):
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                running += count
+                yield "_bucket", bucket_labels, key + (_format_bound(bound),), running
+            yield "_sum", self.labelnames, key, total
+            yield "_count", self.labelnames, key, running
+
+
+REGISTRY: list[Metric] = []
+
+STAGE_SECONDS = Histogram(
+    "smartrecs_stage_seconds", "Wall time of instrumented request stages.", ("stage",)
+)
+CACHE_REQUESTS = Counter(
+    "smartrecs_cache_requests_total", "Cache lookups by cache and result (hit/miss).", ("cache", "result")
+)
+CACHE_ENTRIES = Gauge("smartrecs_cache_entries", "Entries currently held per cache.", ("cache",))
+
+
+def timed(stage: str):
+    """Context manager observing the block's wall time under ``stage``."""
+    return STAGE_SECONDS.time(stage=stage)
+
+
+def timed_function(stage: str):
+    """Decorator form of :func:`timed`."""
+
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def timed_iter(iterable: Iterable, stage: str) -> Iterator:
+    """Yield from ``iterable``, observing the total time spent producing items."""
+    elapsed = 0.0
+    iterator = iter(iterable)
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - started
+            yield item
+    finally:
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def render() -> str:
+    """All registered metrics in Prometheus text exposition format (0.0.4)."""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {_escape(metric.documentation, help_text=True)}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for suffix, names, values, value in metric.samples():
+            labels = ",".join(f'{name}="{_escape(str(label))}"' for name, label in zip(names, values))
+            lines.append(f"{metric.name}{suffix}{{{labels}}} {_format_value(value)}" if labels else f"{metric.name}{suffix} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value: str, help_text: bool = False) -> str:
+    value = value.replace("\\", "\\\\").replace("\n", "\\n")
+    return value if help_text else value.replace('"', '\\"')
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not float(value).is_integer() else str(int(value))
@@ -1,22 +1,70 @@
 """Database models and helpers for SmartRecs."""
 from __future__ import annotations
 
+import json
+import os
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterable, Iterator
+
+from metrics import timed_function
 
 DB_PATH = Path("data/smartrecs.db")
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KIB = 20000
+
+_local = threading.local()
 
 
 def get_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
+    """Return this thread's SQLite connection, opening and tuning it on first use.
+
+    Connections run in autocommit mode; group statements with :func:`transaction`.
+    A forked worker never reuses a connection opened by its parent.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    _local.conn, _local.pid = conn, os.getpid()
     return conn
 
 
+def close_connection() -> None:
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """Run the block in one write transaction; nested blocks join the outer one."""
+    conn = get_connection()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
 def init_db() -> None:
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    with get_connection() as conn:
+    with transaction() as conn:
         conn.execute(
             """
             CREATE TABLE IF NOT EXISTS users (
@@ -42,20 +90,468 @@ def init_db() -> None:
             )
             """
         )
-        conn.commit()
+        # Per-user ratings version, bumped by triggers on every write to user_ratings
+        # so caches can be keyed on it instead of re-reading the ratings themselves.
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS user_rating_versions (
+                user_id INTEGER PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            conn.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS user_ratings_version_{event.lower()}
+                AFTER {event} ON user_ratings
+                BEGIN
+                    INSERT INTO user_rating_versions (user_id, version) VALUES ({row}.user_id, 1)
+                    ON CONFLICT(user_id) DO UPDATE SET version = version + 1;
+                END
+                """
+            )
+        # Dashboard aggregates (rating count/sum and per-genre counts), kept current by
+        # triggers on user_ratings. Genres come from movie_genres, a copy of the catalog's
+        # genre lists maintained by sync_movie_genres(); ``position`` is the pair's place
+        # in catalog order, for breaking top-genre ties. A copy without it is rebuilt.
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(movie_genres)").fetchall()}
+        if columns and "position" not in columns:
+            conn.execute("DROP TABLE movie_genres")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS movie_genres (
+                movie_id INTEGER NOT NULL,
+                genre TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                PRIMARY KEY (movie_id, genre)
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS user_stats (
+                user_id INTEGER PRIMARY KEY,
+                rating_count INTEGER NOT NULL,
+                rating_sum REAL NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS user_genre_counts (
+                user_id INTEGER NOT NULL,
+                genre TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (user_id, genre)
+            )
+            """
+        )
+        for name, event, when, body in _USER_STATS_TRIGGERS:
+            conn.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS user_ratings_stats_{name}
+                AFTER {event} ON user_ratings {when}
+                BEGIN
+                    {body}
+                END
+                """
+            )
+        # Both recommendation stores are disposable caches: ones predating the
+        # model_version key are dropped rather than migrated.
+        for table in ("recommendation_cache", "user_recommendations"):
+            columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+            if columns and "model_version" not in columns:
+                conn.execute(f"DROP TABLE {table}")
+        # One entry per (user, model): workers running different model versions
+        # (e.g. mid-refresh) each keep their own lists instead of overwriting each other's.
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS recommendation_cache (
+                user_id INTEGER NOT NULL,
+                model_version TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (user_id, model_version)
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_recommendation_cache_updated ON recommendation_cache(updated_at)")
+        # OMDB/TMDB responses shared by all workers; failures get a short expiry.
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS metadata_cache (
+                source TEXT NOT NULL,
+                title TEXT NOT NULL,
+                year TEXT NOT NULL,
+                payload TEXT,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (source, title, year)
+            )
+            """
+        )
+        # Offline top-N lists written by `flask precompute-recommendations`.
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS user_recommendations (
+                user_id INTEGER PRIMARY KEY,
+                model_version TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                computed_at REAL NOT NULL
+            )
+            """
+        )
 
 
+@timed_function("sqlite.fetch_one")
 def fetch_one(query: str, params: tuple[Any, ...] = ()) -> sqlite3.Row | None:
-    with get_connection() as conn:
-        return conn.execute(query, params).fetchone()
+    return get_connection().execute(query, params).fetchone()
 
 
+@timed_function("sqlite.fetch_all")
 def fetch_all(query: str, params: tuple[Any, ...] = ()) -> list[sqlite3.Row]:
-    with get_connection() as conn:
-        return conn.execute(query, params).fetchall()
+    return get_connection().execute(query, params).fetchall()
 
 
+@timed_function("sqlite.execute")
 def execute(query: str, params: tuple[Any, ...] = ()) -> None:
-    with get_connection() as conn:
+    with transaction() as conn:
         conn.execute(query, params)
-        conn.commit()
+
+
+@timed_function("sqlite.execute_many")
+def execute_many(query: str, rows: Iterable[tuple[Any, ...]]) -> None:
+    """Run ``query`` for every row inside a single transaction."""
+    with transaction() as conn:
+        conn.executemany(query, rows)
+
+
+def rating_version(user_id: int) -> int:
+    row = fetch_one("SELECT version FROM user_rating_versions WHERE user_id = ?", (user_id,))
+    return row["version"] if row else 0
+
+
+def rating_change_count() -> int:
+    """Total rating writes so far, across every process (the sum of all rating versions)."""
+    row = fetch_one("SELECT COALESCE(SUM(version), 0) AS changes FROM user_rating_versions")
+    return row["changes"]
+
+
+def sync_movie_genres(pairs: Iterable[tuple[int, str]]) -> bool:
+    """Make movie_genres hold exactly ``(movie_id, genre)`` ``pairs``, in catalog order; returns whether it changed.
+
+    When it changes, or the aggregates are missing users (e.g. a database created
+    before they existed), user_stats and user_genre_counts are rebuilt from scratch.
+    """
+    positions: dict[tuple[int, str], int] = {}
+    for movie_id, genre in pairs:
+        positions.setdefault((int(movie_id), str(genre)), len(positions))
+    wanted = {(movie_id, genre, position) for (movie_id, genre), position in positions.items()}
+    with transaction() as conn:
+        current = set(map(tuple, conn.execute("SELECT movie_id, genre, position FROM movie_genres").fetchall()))
+        changed = current != wanted
+        if changed:
+            conn.execute("DELETE FROM movie_genres")
+            conn.executemany("INSERT INTO movie_genres (movie_id, genre, position) VALUES (?, ?, ?)", sorted(wanted))
+        stale = conn.execute(
+            "SELECT (SELECT COUNT(*) FROM user_stats) != (SELECT COUNT(DISTINCT user_id) FROM user_ratings)"
+        ).fetchone()[0]
+        if changed or stale:
+            _rebuild_user_stats(conn)
+    return changed
+
+
+def _rebuild_user_stats(conn: sqlite3.Connection, users: str | None = None) -> None:
+    """Recompute the dashboard aggregates, for every user or those selected by the ``users`` subquery."""
+    where = f"WHERE user_id IN ({users})" if users else ""
+    conn.execute(f"DELETE FROM user_stats {where}")
+    conn.execute(f"DELETE FROM user_genre_counts {where}")
+    conn.execute(
+        f"""
+        INSERT INTO user_stats (user_id, rating_count, rating_sum)
+        SELECT user_id, COUNT(*), SUM(rating) FROM user_ratings {where} GROUP BY user_id
+        """
+    )
+    conn.execute(
+        f"""
+        INSERT INTO user_genre_counts (user_id, genre, count)
+        SELECT r.user_id, g.genre, COUNT(*)
+        FROM user_ratings AS r JOIN movie_genres AS g ON g.movie_id = r.movie_id
+        {where.replace("user_id", "r.user_id", 1)}
+        GROUP BY r.user_id, g.genre
+        """
+    )
+
+
+def user_stats(user_id: int) -> tuple[int, float, str | None]:
+    """``(rating_count, rating_sum, top_genre)`` for the dashboard header.
+
+    Among equally frequent genres the top one is the first met going through the
+    user's rated movies in catalog order. Only such a tie reads the ratings.
+    """
+    row = fetch_one(
+        """
+        SELECT rating_count, rating_sum,
+            (SELECT MAX(count) FROM user_genre_counts AS g WHERE g.user_id = s.user_id) AS top_count
+        FROM user_stats AS s WHERE s.user_id = ?
+        """,
+        (user_id,),
+    )
+    if row is None:
+        return 0, 0.0, None
+    tied = fetch_all(
+        "SELECT genre FROM user_genre_counts WHERE user_id = ? AND count = ?", (user_id, row["top_count"])
+    )
+    top_genre = tied[0]["genre"] if tied else None
+    if len(tied) > 1:
+        first = fetch_one(
+            f"""
+            SELECT g.genre FROM user_ratings AS r JOIN movie_genres AS g ON g.movie_id = r.movie_id
+            WHERE r.user_id = ? AND g.genre IN ({", ".join("?" * len(tied))})
+            ORDER BY g.position LIMIT 1
+            """,
+            (user_id, *(entry["genre"] for entry in tied)),
+        )
+        top_genre = first["genre"]
+    return row["rating_count"], row["rating_sum"], top_genre
+
+
+def upsert_ratings(rows: Iterable[tuple[int, int, float]]) -> int:
+    """Insert or update ``(user_id, movie_id, rating)`` rows in one transaction.
+
+    Rows whose stored rating is already equal are left untouched (no trigger
+    fires, no version moves). Returns the number of rows inserted or changed.
+    """
+    with transaction() as conn:
+        return conn.executemany(
+            """
+            INSERT INTO user_ratings (user_id, movie_id, rating)
+            VALUES (?, ?, ?)
+            ON CONFLICT(user_id, movie_id)
+            DO UPDATE SET rating = excluded.rating WHERE rating != excluded.rating
+            """,
+            rows,
+        ).rowcount
+
+
+@contextmanager
+def deferred_rating_maintenance() -> Iterator[None]:
+    """Run the block in one transaction with user_ratings' triggers and indexes dropped.
+
+    For bulk loads: a single temporary trigger records how many rows each user
+    had written, then the versions are bumped by that count, the dashboard
+    aggregates of those users are recomputed and the dropped triggers and
+    indexes are recreated. Other writers wait for the whole block.
+    """
+    with transaction() as conn:
+        dropped = conn.execute(
+            """
+            SELECT type, name, sql FROM sqlite_master
+            WHERE tbl_name = 'user_ratings' AND type IN ('index', 'trigger') AND sql IS NOT NULL
+            """
+        ).fetchall()
+        for row in dropped:
+            conn.execute(f"DROP {row['type'].upper()} {row['name']}")
+        conn.execute("CREATE TEMP TABLE bulk_rating_changes (user_id INTEGER PRIMARY KEY, changes INTEGER NOT NULL)")
+        for event in ("INSERT", "UPDATE"):
+            conn.execute(
+                f"""
+                CREATE TEMP TRIGGER bulk_rating_changes_{event.lower()}
+                AFTER {event} ON main.user_ratings
+                BEGIN
+                    INSERT INTO bulk_rating_changes (user_id, changes) VALUES (NEW.user_id, 1)
+                    ON CONFLICT(user_id) DO UPDATE SET changes = changes + 1;
+                END
+                """
+            )
+        # On error the transaction rolls back, temporary objects and drops included.
+        yield
+        conn.execute("DROP TRIGGER temp.bulk_rating_changes_insert")
+        conn.execute("DROP TRIGGER temp.bulk_rating_changes_update")
+        conn.execute(
+            """
+            INSERT INTO user_rating_versions (user_id, version)
+            SELECT user_id, changes FROM temp.bulk_rating_changes WHERE true
+            ON CONFLICT(user_id) DO UPDATE SET version = version + excluded.version
+            """
+        )
+        _rebuild_user_stats(conn, "SELECT user_id FROM temp.bulk_rating_changes")
+        conn.execute("DROP TABLE temp.bulk_rating_changes")
+        for row in dropped:
+            conn.execute(row["sql"])
+
+
+def load_cached_recommendations(user_id: int, model_version: str) -> list[dict] | None:
+    """Return the list cached for ``user_id`` by ``model_version`` at their current ratings version."""
+    row = fetch_one(
+        """
+        SELECT c.payload FROM recommendation_cache c
+        LEFT JOIN user_rating_versions v ON v.user_id = c.user_id
+        WHERE c.user_id = ? AND c.model_version = ? AND c.version = COALESCE(v.version, 0)
+        """,
+        (user_id, model_version),
+    )
+    return json.loads(row["payload"]) if row else None
+
+
+def cached_recommendations_current(user_id: int, model_version: str, version: int) -> bool:
+    """Whether the cache still holds the list ``model_version`` built at ratings ``version``, the user's current one."""
+    row = fetch_one(
+        """
+        SELECT 1 FROM recommendation_cache c
+        LEFT JOIN user_rating_versions v ON v.user_id = c.user_id
+        WHERE c.user_id = ? AND c.model_version = ? AND c.version = ? AND c.version = COALESCE(v.version, 0)
+        """,
+        (user_id, model_version, version),
+    )
+    return row is not None
+
+
+def store_cached_recommendations(
+    user_id: int, model_version: str, version: int, recommendations: list[dict], max_entries: int
+) -> None:
+    """Cache ``recommendations`` for one user and model, evicting the oldest entries beyond ``max_entries``."""
+    payload = json.dumps(recommendations, default=_json_default)
+    with transaction() as conn:
+        conn.execute(
+            """
+            INSERT INTO recommendation_cache (user_id, model_version, version, payload, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(user_id, model_version) DO UPDATE SET
+                version = excluded.version, payload = excluded.payload, updated_at = excluded.updated_at
+            """,
+            (user_id, model_version, version, payload, time.time()),
+        )
+        conn.execute(
+            """
+            DELETE FROM recommendation_cache WHERE rowid IN (
+                SELECT rowid FROM recommendation_cache ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (max_entries,),
+        )
+
+
+def active_user_versions() -> dict[int, int]:
+    """Ratings version of every user that has in-app ratings."""
+    rows = fetch_all(
+        """
+        SELECT r.user_id, COALESCE(v.version, 0) AS version
+        FROM (SELECT DISTINCT user_id FROM user_ratings) r
+        LEFT JOIN user_rating_versions v ON v.user_id = r.user_id
+        """
+    )
+    return {row["user_id"]: row["version"] for row in rows}
+
+
+def load_batch_recommendations(user_id: int, model_version: str) -> list[tuple[int, float]] | None:
+    """Precomputed ``(movie_id, score)`` pairs, unless the user rated since the batch ran.
+
+    Only a batch scored by ``model_version`` counts: lists from another model would
+    be served as if this one had produced them.
+    """
+    row = fetch_one(
+        """
+        SELECT b.payload FROM user_recommendations b
+        LEFT JOIN user_rating_versions v ON v.user_id = b.user_id
+        WHERE b.user_id = ? AND b.model_version = ? AND b.version = COALESCE(v.version, 0)
+        """,
+        (user_id, model_version),
+    )
+    return [tuple(pair) for pair in json.loads(row["payload"])] if row else None
+
+
+def store_batch_recommendations(model_version: str, rows: list[tuple[int, int, list[tuple[int, float]]]]) -> None:
+    """Write ``(user_id, version, [(movie_id, score), ...])`` rows scored by ``model_version`` in one transaction."""
+    computed_at = time.time()
+    execute_many(
+        """
+        INSERT INTO user_recommendations (user_id, model_version, version, payload, computed_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            model_version = excluded.model_version, version = excluded.version,
+            payload = excluded.payload, computed_at = excluded.computed_at
+        """,
+        [
+            (user_id, model_version, version, json.dumps(pairs, default=_json_default), computed_at)
+            for user_id, version, pairs in rows
+        ],
+    )
+
+
+def load_metadata(source: str, title: str, year: str) -> tuple[bool, Any]:
+    """Return ``(hit, payload)`` for an unexpired cache entry; a ``None`` payload is a cached failure."""
+    row = fetch_one(
+        "SELECT payload FROM metadata_cache WHERE source = ? AND title = ? AND year = ? AND expires_at > ?",
+        (source, title, year, time.time()),
+    )
+    if row is None:
+        return False, None
+    return True, json.loads(row["payload"]) if row["payload"] is not None else None
+
+
+def store_metadata(source: str, title: str, year: str, payload: Any, ttl: float) -> None:
+    execute(
+        """
+        INSERT INTO metadata_cache (source, title, year, payload, expires_at) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(source, title, year) DO UPDATE SET payload = excluded.payload, expires_at = excluded.expires_at
+        """,
+        (source, title, year, json.dumps(payload) if payload is not None else None, time.time() + ttl),
+    )
+
+
+def purge_expired_metadata() -> int:
+    with transaction() as conn:
+        return conn.execute("DELETE FROM metadata_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+
+
+def cache_entry_counts() -> dict[str, int]:
+    """Entries per persistent cache: recommendations, plus unexpired metadata per source."""
+    counts = {"recommendations": fetch_one("SELECT COUNT(*) AS entries FROM recommendation_cache")["entries"]}
+    rows = fetch_all(
+        "SELECT source, COUNT(*) AS entries FROM metadata_cache WHERE expires_at > ? GROUP BY source", (time.time(),)
+    )
+    counts.update({row["source"]: row["entries"] for row in rows})
+    return counts
+
+
+def _add_rating_sql(row: str, sign: int) -> str:
+    """Trigger statements adding (``sign=1``) or removing (``-1``) rating ``row`` from the aggregates."""
+    return f"""
+        INSERT INTO user_stats (user_id, rating_count, rating_sum) VALUES ({row}.user_id, {sign}, {sign} * {row}.rating)
+        ON CONFLICT(user_id) DO UPDATE SET
+            rating_count = rating_count + excluded.rating_count,
+            rating_sum = rating_sum + excluded.rating_sum;
+        INSERT INTO user_genre_counts (user_id, genre, count)
+        SELECT {row}.user_id, genre, {sign} FROM movie_genres WHERE movie_id = {row}.movie_id
+        ON CONFLICT(user_id, genre) DO UPDATE SET count = count + excluded.count;
+        DELETE FROM user_stats WHERE user_id = {row}.user_id AND rating_count <= 0;
+        DELETE FROM user_genre_counts WHERE user_id = {row}.user_id AND count <= 0;
+    """
+
+
+_USER_STATS_TRIGGERS = (
+    ("insert", "INSERT", "", _add_rating_sql("NEW", 1)),
+    ("delete", "DELETE", "", _add_rating_sql("OLD", -1)),
+    (
+        "rerate",
+        "UPDATE OF rating",
+        "WHEN OLD.user_id = NEW.user_id AND OLD.movie_id = NEW.movie_id",
+        "UPDATE user_stats SET rating_sum = rating_sum + NEW.rating - OLD.rating WHERE user_id = NEW.user_id;",
+    ),
+    (
+        "move",
+        "UPDATE OF user_id, movie_id",
+        "WHEN OLD.user_id != NEW.user_id OR OLD.movie_id != NEW.movie_id",
+        _add_rating_sql("OLD", -1) + _add_rating_sql("NEW", 1),
+    ),
+)
+
+
+def _json_default(value: Any) -> Any:
+    # NumPy scalars coming out of pandas records.
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
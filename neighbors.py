@@ -0,0 +1,299 @@
+"""Top-K user neighbor index for SmartRecs collaborative filtering.
+
+Instead of comparing a user against every other account on each request, the
+index keeps every user's K most similar users. It is built either exactly
+(block-wise sparse products over all users) or approximately with random
+projection LSH (SimHash), and it is updated per user when ratings change.
+"""
+from __future__ import annotations
+
+import threading
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+if TYPE_CHECKING:
+    from recommender import UserItemMatrix
+
+NEIGHBOR_MODES = ("exact", "lsh")
+
+
+class NeighborIndex:
+    """Each user's top-K most similar users over a :class:`UserItemMatrix`.
+
+    ``mode="exact"`` ranks each user against all others; ``mode="lsh"`` only
+    ranks users sharing at least one of ``n_tables`` SimHash buckets of
+    ``n_bits`` random hyperplanes each.
+
+    Updates find the lists holding a user through a reverse map (built with the
+    index, plus the rows listed since) instead of scanning every list. A slot the
+    user drops out of stays empty until the next build; once more than
+    ``max_freed_fraction`` of all slots are empty :attr:`needs_rebuild` asks the
+    owner to rebuild off the request path.
+    """
+
+    def __init__(
+        self,
+        user_items: UserItemMatrix,
+        k: int = 50,
+        mode: str = "exact",
+        n_tables: int = 16,
+        n_bits: int = 4,
+        seed: int = 0,
+        block_size: int | None = None,
+        build: bool = True,
+        max_freed_fraction: float = 0.01,
+    ) -> None:
+        if mode not in NEIGHBOR_MODES:
+            raise ValueError(f"mode must be one of {NEIGHBOR_MODES}, got {mode!r}")
+        self.user_items = user_items
+        self.k = k
+        self.mode = mode
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.block_size = block_size
+        self.seed = seed
+        self.max_freed_fraction = max_freed_fraction
+        self._rng = np.random.default_rng(seed)
+        self._planes = np.zeros((0, n_tables * n_bits))
+        self._lock = threading.Lock()
+        self._reset_reverse()
+        if build:
+            self.build()
+
+    @classmethod
+    def from_arrays(cls, user_items: UserItemMatrix, arrays: dict[str, np.ndarray], **options) -> NeighborIndex:
+        """Restore an index saved with :meth:`arrays` without recomputing it.
+
+        The neighbor arrays may be memory-mapped copy-on-write: updates touch only
+        private copies of the pages they change.
+        """
+        index = cls(user_items, build=False, **options)
+        user_ids = np.asarray(arrays["user_ids"])
+        index._rows = dict(zip(user_ids.tolist(), range(len(user_ids))))
+        index._neighbor_ids = arrays["neighbor_ids"]
+        index._neighbor_sims = arrays["neighbor_sims"]
+        if index.mode == "lsh":
+            index._planes = np.array(arrays["planes"])
+            index._index_buckets(user_ids, np.asarray(arrays["keys"]))
+        return index
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        """The index as plain arrays, for :meth:`from_arrays`."""
+        with self._lock:
+            user_ids = np.fromiter(self._rows, dtype=np.int64, count=len(self._rows))
+            arrays = {
+                "user_ids": user_ids,
+                "neighbor_ids": self._neighbor_ids[: len(user_ids)],
+                "neighbor_sims": self._neighbor_sims[: len(user_ids)],
+            }
+            if self.mode == "lsh":
+                keyed = [self._keys.get(user_id) for user_id in user_ids.tolist()]
+                missing = np.full(self.n_tables, -1, dtype=np.int64)
+                arrays["planes"] = self._planes
+                arrays["keys"] = np.vstack([missing if keys is None else keys for keys in keyed] or [missing[:0]])
+        return arrays
+
+    def build(self) -> None:
+        """(Re)compute the neighbor lists of every user."""
+        user_ids, vectors = self.user_items.vectors()
+        vectors = normalize(vectors)
+        neighbor_ids = np.full((len(user_ids), self.k), -1, dtype=np.int64)
+        neighbor_sims = np.zeros((len(user_ids), self.k))
+
+        block_size = self.block_size or max(1, min(1024, 2**24 // max(1, len(user_ids))))
+        if self.mode == "exact":
+            for start in range(0, len(user_ids), block_size):
+                block = (vectors[start : start + block_size] @ vectors.T).toarray()
+                block[np.arange(block.shape[0]), np.arange(start, start + block.shape[0])] = 0.0
+                ids, sims = self._top_k(block, user_ids)
+                neighbor_ids[start : start + block_size] = ids
+                neighbor_sims[start : start + block_size] = sims
+        else:
+            # Rank users only against their bucket-mates, one bucket at a time, and
+            # merge each table's candidates into the running top-K.
+            keys = self._signatures(vectors)
+            for buckets in self._index_buckets(user_ids, keys):
+                for members in buckets:
+                    if len(members) < 2:
+                        continue
+                    candidates = vectors[members].T
+                    for start in range(0, len(members), block_size):
+                        rows = members[start : start + block_size]
+                        block = (vectors[rows] @ candidates).toarray()
+                        block[np.arange(len(rows)), np.arange(start, start + len(rows))] = 0.0
+                        ids = np.concatenate([neighbor_ids[rows], np.broadcast_to(user_ids[members], block.shape)], axis=1)
+                        sims = np.concatenate([neighbor_sims[rows], block], axis=1)
+                        neighbor_ids[rows], neighbor_sims[rows] = self._top_k(*_dedupe(ids, sims))
+
+        with self._lock:
+            self._rows = dict(zip(user_ids.tolist(), range(len(user_ids))))
+            self._neighbor_ids = neighbor_ids
+            self._neighbor_sims = neighbor_sims
+            self._reset_reverse()
+            self._index_reverse()
+
+    @property
+    def needs_rebuild(self) -> bool:
+        return self._freed_slots > self.max_freed_fraction * self.k * max(1, len(self._rows))
+
+    def _reset_reverse(self) -> None:
+        self._reverse: tuple[np.ndarray, np.ndarray] | None = None
+        self._listed_since: dict[int, set[int]] = {}
+        self._freed_slots = 0
+
+    def _index_reverse(self) -> None:
+        """Sort the current lists by neighbor id: ``(neighbor ids, rows listing them)``."""
+        flat = np.asarray(self._neighbor_ids[: len(self._rows)]).ravel()
+        order = np.argsort(flat, kind="stable")
+        self._reverse = (flat[order], order // self.k)
+
+    def _rows_listing(self, user_id: int) -> np.ndarray:
+        """Rows that may hold ``user_id``: listed at build time or since. Callers re-check the ids."""
+        if self._reverse is None:
+            self._index_reverse()
+        ids, rows = self._reverse
+        rows = rows[np.searchsorted(ids, user_id, "left") : np.searchsorted(ids, user_id, "right")]
+        since = self._listed_since.get(user_id)
+        if since:
+            rows = np.union1d(rows, np.fromiter(since, dtype=np.int64, count=len(since)))
+        return rows
+
+    def _index_buckets(self, user_ids: np.ndarray, keys: np.ndarray) -> list[list[np.ndarray]]:
+        """Fill the bucket maps from every user's keys; return each table's member positions."""
+        known = keys[:, 0] >= 0 if len(keys) else np.zeros(0, dtype=bool)
+        self._keys = dict(zip(user_ids[known].tolist(), keys[known]))
+        self._buckets = [dict() for _ in range(self.n_tables)]
+        tables = []
+        for table in range(self.n_tables):
+            order = np.flatnonzero(known)[np.argsort(keys[known, table], kind="stable")]
+            values, starts = np.unique(keys[order, table], return_index=True)
+            members = np.split(order, starts[1:]) if len(order) else []
+            for value, positions in zip(values.tolist(), members):
+                self._buckets[table][value] = set(user_ids[positions].tolist())
+            tables.append(members)
+        return tables
+
+    def neighbors(self, user_id: int) -> pd.Series:
+        """The user's neighbors as ``user_id -> similarity``, most similar first."""
+        with self._lock:
+            row = self._rows.get(user_id)
+            if row is None:
+                return pd.Series(dtype=np.float64)
+            ids, sims = self._neighbor_ids[row], self._neighbor_sims[row]
+            keep = ids >= 0
+            neighbors = pd.Series(sims[keep], index=ids[keep])
+        return neighbors.sort_values(ascending=False)
+
+    def update_user(self, user_id: int) -> None:
+        """Refresh one user's neighbor list and their slot in everybody else's."""
+        candidates = None
+        if self.mode == "lsh":
+            candidates = self._rehash(user_id)
+        sims = self.user_items.similarities(user_id, candidates)
+        sims = sims[sims > 0]
+
+        with self._lock:
+            row = self._ensure_row(user_id)
+            ids, top = self._top_k(sims.to_numpy()[None, :], sims.index.to_numpy())
+            self._neighbor_ids[row], self._neighbor_sims[row] = ids[0], top[0]
+            for neighbor in ids[0][ids[0] >= 0].tolist():
+                self._listed_since.setdefault(neighbor, set()).add(row)
+
+            # Drop the user from the lists holding them, then re-insert where they now beat the weakest slot.
+            listing = self._rows_listing(user_id)
+            held, slots = np.nonzero(self._neighbor_ids[listing] == user_id)
+            listing = listing[held]
+            self._neighbor_ids[listing, slots] = -1
+            self._neighbor_sims[listing, slots] = 0.0
+            refilled = np.zeros(0, dtype=np.int64)
+            if not sims.empty:
+                rows = np.fromiter((self._rows.get(other, -1) for other in sims.index.tolist()), dtype=np.int64, count=len(sims))
+                found = rows >= 0
+                rows, values = rows[found], sims.to_numpy()[found]
+                weakest = np.argmin(self._neighbor_sims[rows], axis=1)
+                better = values > self._neighbor_sims[rows, weakest]
+                refilled = rows[better]
+                self._neighbor_ids[refilled, weakest[better]] = user_id
+                self._neighbor_sims[refilled, weakest[better]] = values[better]
+            self._listed_since[user_id] = set(refilled.tolist())
+            self._freed_slots += len(np.setdiff1d(listing, refilled))
+
+    def _top_k(self, sims: np.ndarray, ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Row-wise top-K of a (rows x candidates) similarity block, padded with -1/0.
+
+        ``ids`` labels the candidates, either per column or per cell.
+        """
+        k = min(self.k, sims.shape[1])
+        top_ids = np.full((sims.shape[0], self.k), -1, dtype=np.int64)
+        top_sims = np.zeros((sims.shape[0], self.k))
+        if k == 0:
+            return top_ids, top_sims
+        positions = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        values = np.take_along_axis(sims, positions, axis=1)
+        labels = ids[positions] if ids.ndim == 1 else np.take_along_axis(ids, positions, axis=1)
+        positive = values > 0
+        top_ids[:, :k] = np.where(positive, labels, -1)
+        top_sims[:, :k] = np.where(positive, values, 0.0)
+        return top_ids, top_sims
+
+    def _ensure_row(self, user_id: int) -> int:
+        row = self._rows.get(user_id)
+        if row is not None:
+            return row
+        row = len(self._rows)
+        if row >= len(self._neighbor_ids):
+            grow = max(16, len(self._neighbor_ids))
+            self._neighbor_ids = np.vstack([self._neighbor_ids, np.full((grow, self.k), -1, dtype=np.int64)])
+            self._neighbor_sims = np.vstack([self._neighbor_sims, np.zeros((grow, self.k))])
+        self._rows[user_id] = row
+        return row
+
+    def _signatures(self, vectors: sparse.csr_matrix) -> np.ndarray:
+        """SimHash bucket key of every row, one column per table."""
+        missing = vectors.shape[1] - len(self._planes)
+        if missing > 0:
+            self._planes = np.vstack([self._planes, self._rng.standard_normal((missing, self.n_tables * self.n_bits))])
+        bits = (vectors @ self._planes[: vectors.shape[1]]) > 0
+        weights = 1 << np.arange(self.n_bits, dtype=np.int64)
+        return bits.reshape(len(bits), self.n_tables, self.n_bits) @ weights
+
+    def _candidates(self, user_id: int) -> set[int]:
+        keys = self._keys.get(user_id)
+        if keys is None:
+            return set()
+        candidates: set[int] = set()
+        for table, key in enumerate(keys.tolist()):
+            candidates |= self._buckets[table].get(key, set())
+        candidates.discard(user_id)
+        return candidates
+
+    def _rehash(self, user_id: int) -> list[int]:
+        """Move the user to the buckets of their current ratings; return bucket-mates."""
+        with self._lock:
+            old_keys = self._keys.pop(user_id, None)
+            if old_keys is not None:
+                for table, key in enumerate(old_keys.tolist()):
+                    self._buckets[table].get(key, set()).discard(user_id)
+            ids, vectors = self.user_items.vectors([user_id])
+            if not len(ids):
+                return []
+            keys = self._signatures(normalize(vectors))[0]
+            self._keys[user_id] = keys
+            for table, key in enumerate(keys.tolist()):
+                self._buckets[table].setdefault(key, set()).add(user_id)
+            return sorted(self._candidates(user_id))
+
+
+def _dedupe(ids: np.ndarray, sims: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Zero out repeated candidate ids within each row (found via several LSH tables)."""
+    order = np.argsort(ids, axis=1, kind="stable")
+    ids = np.take_along_axis(ids, order, axis=1)
+    sims = np.take_along_axis(sims, order, axis=1)
+    repeated = np.zeros(ids.shape, dtype=bool)
+    repeated[:, 1:] = ids[:, 1:] == ids[:, :-1]
+    sims[repeated] = 0.0
+    return sims, ids
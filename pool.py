@@ -0,0 +1,83 @@
+"""Multi-process batch scoring for SmartRecs.
+
+Scoring is NumPy/pandas work that holds the GIL between kernels, so one process
+uses about one core. :class:`ScoringPool` shards users across worker processes
+instead. The workers memory-map a model written by :meth:`SmartRecommender.save`,
+so the matrices are shared through the page cache rather than pickled to each
+worker: only user ids go out and ``(movie_id, score)`` top-N lists come back.
+"""
+from __future__ import annotations
+
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from recommender import SmartRecommender
+
+# Shards per worker: enough to even out slow shards while each shard still
+# scores whole blocks.
+SHARDS_PER_WORKER = 4
+
+_model: SmartRecommender | None = None
+
+
+def _load_model(path: str) -> None:
+    global _model
+    _model = SmartRecommender.load(path)
+
+
+def _score_shard(user_ids: list[int], top_n: int, block_size: int) -> dict[int, tuple[list[int], list[float]]]:
+    results = _model.recommend_many(user_ids, top_n=top_n, block_size=block_size)
+    return {user_id: (frame["movie_id"].tolist(), frame["score"].tolist()) for user_id, frame in results.items()}
+
+
+class ScoringPool:
+    """``workers`` processes scoring against a saved snapshot of ``recommender``'s model.
+
+    The snapshot is taken when the pool starts (into a temporary directory unless
+    ``model_path`` names one to write), so results match ``recommender`` as it was
+    then. Use as a context manager, or call :meth:`close`.
+    """
+
+    def __init__(self, recommender: SmartRecommender, workers: int, model_path: str | Path | None = None) -> None:
+        if workers < 1:
+            raise ValueError(f"workers must be at least 1, got {workers}")
+        self.recommender = recommender
+        self.workers = workers
+        self._tempdir = None
+        if model_path is None:
+            self._tempdir = tempfile.TemporaryDirectory(prefix="smartrecs-pool-")
+            model_path = Path(self._tempdir.name) / "model"
+        self.model_path = recommender.save(model_path)
+        # spawn: forking a process that runs refresh/metadata threads is not safe.
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_load_model,
+            initargs=(str(self.model_path),),
+        )
+
+    def recommend_many(self, user_ids: list[int], top_n: int = 10, block_size: int = 256) -> dict[int, pd.DataFrame]:
+        """:meth:`SmartRecommender.recommend_many`, sharded across the workers."""
+        shard_count = min(self.workers * SHARDS_PER_WORKER, max(1, -(-len(user_ids) // block_size)))
+        shards = [shard.tolist() for shard in np.array_split(np.asarray(user_ids, dtype=np.int64), shard_count) if len(shard)]
+        results: dict[int, pd.DataFrame] = {}
+        for scored in self._executor.map(_score_shard, shards, [top_n] * len(shards), [block_size] * len(shards)):
+            for user_id, (movie_ids, scores) in scored.items():
+                results[user_id] = self.recommender.movies_with_scores(movie_ids, scores)
+        return results
+
+    def close(self) -> None:
+        self._executor.shutdown()
+        if self._tempdir is not None:
+            self._tempdir.cleanup()
+
+    def __enter__(self) -> ScoringPool:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
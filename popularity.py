@@ -0,0 +1,133 @@
+"""Popularity ranking for SmartRecs cold-start users.
+
+Movies are ranked by Bayesian-average rating: each movie's mean is shrunk
+towards the global mean by ``prior_votes`` phantom ratings, so a handful of
+5-star votes does not outrank a widely loved movie. Ties go to the more-rated
+movie, then to catalog order. Per-genre and per-year rankings are slices of the
+global one, built on first use and cached until the next re-sort.
+
+Rating writes update the per-movie counts and sums in O(1); the order is
+re-sorted lazily, once ``resort_every`` writes have accumulated, so serving a
+ranking is a slice of a precomputed array.
+"""
+from __future__ import annotations
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from ratings import RatingsStore
+from search import CatalogFilterIndex
+
+RESORT_EVERY = 64
+# Cached slice orders kept between re-sorts; genre filters are free text.
+MAX_CACHED_SLICES = 256
+
+
+class PopularityRanking:
+    """Bayesian-average ranking over the catalog rows of ``movies_df``.
+
+    ``counts`` and ``sums`` hold the number and total of ratings per catalog row.
+    ``prior_votes`` defaults to the median rating count of rated movies and
+    ``prior_mean`` to the global mean rating; both stay fixed between rebuilds so
+    incremental updates never reshuffle unrelated movies.
+    """
+
+    def __init__(
+        self,
+        movies_df: pd.DataFrame,
+        counts: np.ndarray,
+        sums: np.ndarray,
+        prior_votes: float | None = None,
+        prior_mean: float | None = None,
+        resort_every: int = RESORT_EVERY,
+    ) -> None:
+        self.movie_index = pd.Index(movies_df["movie_id"])
+        self.counts = counts
+        self.sums = sums
+        rated = counts[counts > 0]
+        self.prior_votes = float(prior_votes if prior_votes is not None else (np.median(rated) if len(rated) else 1.0))
+        self.prior_mean = float(prior_mean if prior_mean is not None else (sums.sum() / counts.sum() if counts.sum() else 0.0))
+        self.resort_every = resort_every
+        self._movies_df = movies_df
+        self._filters: CatalogFilterIndex | None = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._resort()
+
+    @classmethod
+    def from_store(cls, ratings: RatingsStore, movies_df: pd.DataFrame, **options) -> PopularityRanking:
+        catalog_positions = pd.Index(movies_df["movie_id"]).get_indexer(ratings.movie_ids)
+        known = catalog_positions >= 0
+        per_movie_counts = np.bincount(ratings.movie_codes, minlength=len(ratings.movie_ids))
+        per_movie_sums = np.bincount(ratings.movie_codes, weights=ratings.ratings, minlength=len(ratings.movie_ids))
+        counts = np.zeros(len(movies_df))
+        sums = np.zeros(len(movies_df))
+        counts[catalog_positions[known]] = per_movie_counts[known]
+        sums[catalog_positions[known]] = per_movie_sums[known]
+        return cls(movies_df, counts, sums, **options)
+
+    @property
+    def scores(self) -> np.ndarray:
+        """Bayesian-average rating of every catalog row."""
+        return (self.prior_votes * self.prior_mean + self.sums) / (self.prior_votes + self.counts)
+
+    def update(self, before: dict[int, float], after: dict[int, float]) -> None:
+        """Account for one user's ratings changing from ``before`` to ``after`` (``{movie_id: rating}``)."""
+        changed = [movie_id for movie_id in before.keys() | after.keys() if before.get(movie_id) != after.get(movie_id)]
+        if not changed:
+            return
+        positions = self.movie_index.get_indexer(changed)
+        with self._lock:
+            for movie_id, position in zip(changed, positions.tolist()):
+                if position < 0:
+                    continue
+                old, new = before.get(movie_id), after.get(movie_id)
+                self.counts[position] += (new is not None) - (old is not None)
+                self.sums[position] += (new or 0.0) - (old or 0.0)
+            self._pending += 1
+
+    def top(
+        self, top_n: int, exclude: set[int] | None = None, genre: str | None = None, year: str | None = None
+    ) -> np.ndarray:
+        """Catalog positions of the ``top_n`` best-ranked movies, skipping ``exclude`` (movie ids).
+
+        ``genre`` and ``year`` restrict the ranking to the movies the catalog
+        filters match: a case-insensitive substring of the genre list and the
+        displayed year.
+        """
+        if self._pending >= self.resort_every:
+            with self._lock:
+                if self._pending >= self.resort_every:
+                    self._resort()
+        order = self._slice_order(genre, year)
+        if not exclude:
+            return order[:top_n]
+        skip = set(self.movie_index.get_indexer(list(exclude)).tolist())
+        chosen = [position for position in order[: top_n + len(skip)].tolist() if position not in skip]
+        return np.asarray(chosen[:top_n], dtype=np.int64)
+
+    def _resort(self) -> None:
+        # Lock held (or not yet shared). Best score first, then most ratings, then catalog order.
+        self._order = np.lexsort((np.arange(len(self.counts)), -self.counts, -self.scores))
+        self._slice_orders: dict[tuple, np.ndarray] = {}
+        self._pending = 0
+
+    def _slice_order(self, genre: str | None, year: str | None) -> np.ndarray:
+        order = self._order
+        keys = [("genre", genre.strip().lower()) if genre else None, ("year", year.strip()) if year else None]
+        keys = [key for key in keys if key is not None]
+        if not keys:
+            return order
+        cache_key = tuple(keys)
+        cached = self._slice_orders.get(cache_key)
+        if cached is None:
+            if self._filters is None:
+                self._filters = CatalogFilterIndex(self._movies_df)
+            mask = np.zeros(len(order), dtype=bool)
+            mask[self._filters.filter(year or "", genre or "")] = True
+            if len(self._slice_orders) >= MAX_CACHED_SLICES:
+                self._slice_orders.clear()
+            cached = self._slice_orders[cache_key] = order[mask[order]]
+        return cached
@@ -7,86 +7,813 @@ This module combines:
 """
 from __future__ import annotations
 
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable
+
 import numpy as np
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy import sparse
+from sklearn.preprocessing import normalize
 
+from als import ALSModel
+from catalog import Catalog, load_catalog, read_catalog, save_catalog
+from item_neighbors import ItemNeighborTable, table_path_for
+from metrics import timed
+from neighbors import NeighborIndex
+from popularity import PopularityRanking
+from ratings import RatingsStore
 
-class SmartRecommender:
-    def __init__(self, movies_path: str = "data/movies.csv", ratings_path: str = "data/ratings.csv") -> None:
-        self.movies_df = pd.read_csv(movies_path)
-        self.ratings_df = pd.read_csv(ratings_path)
 
-        # Normalize genre text to a space-delimited form so TF-IDF can tokenize it.
-        self.movies_df["genre_text"] = self.movies_df["genres"].str.replace("|", " ", regex=False)
+COLLAB_BACKENDS = ("user_cosine", "als")
+MODEL_FORMAT = "smartrecs-model"
+MODEL_FORMAT_VERSION = 1
+
+
+class UserItemMatrix:
+    """Sparse (CSR) user x movie rating matrix with user/movie index maps.
+
+    The bulk of the ratings lives in an immutable CSR ``matrix`` whose rows follow
+    ``user_ids`` and whose columns follow ``movie_ids``, so a MovieLens-25M sized
+    ratings table only costs its non-zero entries. Users whose ratings change
+    afterwards are kept as small per-user overrides layered on top, which makes a
+    write O(user's ratings) instead of a rebuild. Once there are more than
+    ``max_overrides`` of them :attr:`needs_compaction` asks the owner to fold them
+    into a new base off the request path (:meth:`SmartRecommender.compact`).
+    """
+
+    def __init__(self, ratings: RatingsStore, max_overrides: int = 2048) -> None:
+        self.max_overrides = max_overrides
+        self._lock = threading.RLock()
+        self._build(ratings)
+
+    @classmethod
+    def from_csr(
+        cls, matrix: sparse.csr_matrix, user_ids: np.ndarray, movie_ids: np.ndarray, max_overrides: int = 2048
+    ) -> UserItemMatrix:
+        """Wrap an existing base matrix (e.g. memory-mapped from a saved model) without copying it."""
+        user_items = cls.__new__(cls)
+        user_items.max_overrides = max_overrides
+        user_items._lock = threading.RLock()
+        user_items._set_base(matrix, user_ids, movie_ids)
+        return user_items
+
+    def _build(self, ratings: RatingsStore) -> None:
+        # The CSR shares the store's indptr and movie codes. Only the values are
+        # widened to float64: a float32 matrix would be upcast (copied) by every
+        # product with the float64 similarity vectors.
+        matrix = sparse.csr_matrix(
+            (ratings.ratings.astype(np.float64), ratings.movie_codes, ratings.indptr),
+            shape=(len(ratings.user_ids), len(ratings.movie_ids)),
+        )
+        self._set_base(matrix, ratings.user_ids, ratings.movie_ids)
+
+    def _set_base(self, matrix: sparse.csr_matrix, user_ids: np.ndarray, movie_ids: np.ndarray) -> None:
+        self.matrix = matrix
+        self.user_ids = pd.Index(user_ids)
+        self.movie_ids = movie_ids
+        self._movie_columns = dict(zip(self.movie_ids.tolist(), range(len(self.movie_ids))))
+        self.row_norms = np.sqrt(np.asarray(self.matrix.multiply(self.matrix).sum(axis=1)).ravel())
+        self._overrides: dict[int, dict[int, float]] = {}
+        self._delta: tuple | None = None
+
+    @property
+    def has_overrides(self) -> bool:
+        return bool(self._overrides)
+
+    @property
+    def needs_compaction(self) -> bool:
+        return len(self._overrides) > self.max_overrides
+
+    def user_row(self, user_id: int) -> int | None:
+        try:
+            return int(self.user_ids.get_loc(user_id))
+        except KeyError:
+            return None
+
+    def ratings_for(self, user_id: int) -> dict[int, float]:
+        """Return the user's current ``{movie_id: rating}`` map (empty if unknown)."""
+        with self._lock:
+            if user_id in self._overrides:
+                return dict(self._overrides[user_id])
+            row = self.user_row(user_id)
+            if row is None:
+                return {}
+            start, end = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+            movie_ids = self.movie_ids[self.matrix.indices[start:end]]
+            return dict(zip(movie_ids.tolist(), self.matrix.data[start:end].tolist()))
+
+    def set_user(self, user_id: int, ratings: dict[int, float]) -> None:
+        """Replace every rating of one user."""
+        with self._lock:
+            new_movies = [movie_id for movie_id in ratings if movie_id not in self._movie_columns]
+            if new_movies:
+                self._movie_columns.update(zip(new_movies, range(len(self.movie_ids), len(self.movie_ids) + len(new_movies))))
+                self.movie_ids = np.concatenate([self.movie_ids, np.asarray(new_movies, dtype=self.movie_ids.dtype)])
+            self._overrides[user_id] = {movie_id: float(rating) for movie_id, rating in ratings.items()}
+            self._delta = None
+
+    def set_rating(self, user_id: int, movie_id: int, rating: float) -> None:
+        with self._lock:
+            ratings = self.ratings_for(user_id)
+            ratings[movie_id] = rating
+            self.set_user(user_id, ratings)
+
+    def to_store(self) -> RatingsStore:
+        """Flatten the base matrix plus overrides back into a ratings store."""
+        with self._lock:
+            coo = self.matrix.tocoo()
+            user_ids, movie_ids, values = self.user_ids.to_numpy()[coo.row], self.movie_ids[coo.col], coo.data
+            if self._overrides:
+                keep = ~np.isin(user_ids, list(self._overrides))
+                pairs = [
+                    (user_id, movie_id, rating)
+                    for user_id, ratings in self._overrides.items()
+                    for movie_id, rating in ratings.items()
+                ]
+                overrides = np.asarray(pairs, dtype=np.float64).reshape(-1, 3)
+                user_ids = np.concatenate([user_ids[keep], overrides[:, 0].astype(np.int64)])
+                movie_ids = np.concatenate([movie_ids[keep], overrides[:, 1].astype(np.int64)])
+                values = np.concatenate([values[keep], overrides[:, 2]])
+            return RatingsStore.from_arrays(user_ids, movie_ids, values)
+
+    def _delta_state(self) -> tuple:
+        """CSR of overridden users plus the base rows they shadow (built lazily)."""
+        if self._delta is None:
+            users = list(self._overrides)
+            indptr = np.zeros(len(users) + 1, dtype=np.int64)
+            indices: list[int] = []
+            data: list[float] = []
+            for position, user_id in enumerate(users):
+                ratings = self._overrides[user_id]
+                indices.extend(self._movie_columns[movie_id] for movie_id in ratings)
+                data.extend(ratings.values())
+                indptr[position + 1] = len(indices)
+            delta = sparse.csr_matrix(
+                (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int64), indptr),
+                shape=(len(users), len(self.movie_ids)),
+            )
+            norms = np.sqrt(np.asarray(delta.multiply(delta).sum(axis=1)).ravel())
+            shadowed = self.user_ids.get_indexer(users)
+            self._delta = (users, delta, norms, shadowed[shadowed >= 0])
+        return self._delta
+
+    def _target(self, user_id: int) -> tuple | None:
+        """Dense rating vector of one user plus the state needed to compare it (lock held)."""
+        ratings = self.ratings_for(user_id)
+        if not ratings:
+            return None
+        columns = np.fromiter((self._movie_columns[movie_id] for movie_id in ratings), dtype=np.int64, count=len(ratings))
+        target = np.zeros(len(self.movie_ids))
+        target[columns] = list(ratings.values())
+        base_row = None if user_id in self._overrides else self.user_row(user_id)
+        return target, columns, base_row, self._delta_state()
+
+    def _full_similarities(self, user_id: int, target: np.ndarray, base_row: int | None, delta_state: tuple) -> tuple:
+        delta_users, delta, delta_norms, shadowed = delta_state
+        target_norm = float(np.sqrt(target @ target))
+        base_sims = _cosine_to(self.matrix @ target[: self.matrix.shape[1]], self.row_norms, target_norm)
+        base_sims[shadowed] = 0.0
+        if base_row is not None:
+            base_sims[base_row] = 0.0
+        delta_sims = _cosine_to(delta @ target[: delta.shape[1]], delta_norms, target_norm)
+        if user_id in delta_users:
+            delta_sims[delta_users.index(user_id)] = 0.0
+        return base_sims, delta_sims
+
+    def similarities(self, user_id: int, candidates: list[int] | None = None) -> pd.Series:
+        """Cosine similarity of ``user_id`` to every other user (or just ``candidates``)."""
+        with self._lock:
+            state = self._target(user_id)
+            if state is None:
+                return pd.Series(dtype=np.float64)
+            target, _, base_row, delta_state = state
+            delta_users, delta, delta_norms, shadowed = delta_state
+            if candidates is None:
+                base_sims, delta_sims = self._full_similarities(user_id, target, base_row, delta_state)
+                keep = np.ones(len(base_sims), dtype=bool)
+                keep[shadowed] = False
+                ids = np.concatenate([self.user_ids.to_numpy()[keep], np.asarray(delta_users, dtype=np.int64)])
+                sims = pd.Series(np.concatenate([base_sims[keep], delta_sims]), index=ids)
+                return sims.drop(user_id, errors="ignore")
+
+            target_norm = float(np.sqrt(target @ target))
+            rows = self.vectors([c for c in candidates if c != user_id])
+        candidate_ids, vectors = rows
+        norms = np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis=1)).ravel())
+        sims = _cosine_to(vectors @ target[: vectors.shape[1]], norms, target_norm)
+        return pd.Series(sims, index=candidate_ids)
+
+    def vectors(self, user_ids: list[int] | None = None) -> tuple[np.ndarray, sparse.csr_matrix]:
+        """Current rating rows for ``user_ids`` (default: every user) as ``(ids, CSR)``."""
+        with self._lock:
+            width = len(self.movie_ids)
+            if user_ids is None:
+                delta_users, delta, _, shadowed = self._delta_state()
+                keep = np.ones(self.matrix.shape[0], dtype=bool)
+                keep[shadowed] = False
+                ids = np.concatenate([self.user_ids.to_numpy()[keep], np.asarray(delta_users, dtype=np.int64)])
+                parts = [self.matrix[keep], delta]
+            else:
+                base_positions, base_rows, delta_positions, delta_rows = self._rows(user_ids)
+                ids = np.asarray(user_ids, dtype=np.int64)[np.concatenate([base_positions, delta_positions])]
+                parts = [base_rows, delta_rows]
+        parts = [sparse.csr_matrix((part.data, part.indices, part.indptr), shape=(part.shape[0], width)) for part in parts]
+        return ids, sparse.vstack(parts, format="csr")
+
+    def _rows(self, user_ids: list[int]) -> tuple:
+        """Rows of ``user_ids`` split into base and override rows (lock held).
+
+        Returns ``(base_positions, base_rows, delta_positions, delta_rows)`` where the
+        positions index into ``user_ids``; unknown users are skipped.
+        """
+        delta_users, delta, _, _ = self._delta_state()
+        base_positions, base_rows, delta_positions, delta_rows = [], [], [], []
+        delta_lookup = {user_id: position for position, user_id in enumerate(delta_users)} if delta_users else {}
+        for position, user_id in enumerate(user_ids):
+            if user_id in delta_lookup:
+                delta_positions.append(position)
+                delta_rows.append(delta_lookup[user_id])
+                continue
+            row = self.user_row(user_id)
+            if row is not None:
+                base_positions.append(position)
+                base_rows.append(row)
+        return (
+            np.asarray(base_positions, dtype=np.int64),
+            self.matrix[base_rows],
+            np.asarray(delta_positions, dtype=np.int64),
+            delta[delta_rows],
+        )
+
+    def predict(self, user_id: int, neighbors: pd.Series | None = None) -> pd.Series | None:
+        """Similarity-weighted average of neighbor ratings for the user's unseen movies.
+
+        By default every other user is a neighbor. ``neighbors`` (user_id -> similarity,
+        e.g. from a :class:`neighbors.NeighborIndex`) restricts the average to those users.
+        Returns ``None`` when the user has no ratings in the matrix.
+        """
+        with self._lock:
+            state = self._target(user_id)
+            if state is None:
+                return None
+            target, columns, base_row, delta_state = state
+            movie_ids = self.movie_ids
+            if neighbors is None:
+                matrix, delta = self.matrix, delta_state[1]
+                base_sims, delta_sims = self._full_similarities(user_id, target, base_row, delta_state)
+            else:
+                neighbor_ids = neighbors.index.to_numpy()
+                sims = np.where(neighbor_ids == user_id, 0.0, neighbors.to_numpy(dtype=np.float64))
+                base_positions, matrix, delta_positions, delta = self._rows(neighbor_ids.tolist())
+                base_sims, delta_sims = sims[base_positions], sims[delta_positions]
+
+        denominator = float(np.abs(base_sims).sum() + np.abs(delta_sims).sum())
+        predictions = np.zeros(len(movie_ids))
+        if denominator > 0:
+            predictions[: matrix.shape[1]] += matrix.T @ base_sims
+            predictions[: delta.shape[1]] += delta.T @ delta_sims
+            predictions /= denominator
+
+        unseen = np.ones(len(movie_ids), dtype=bool)
+        unseen[columns[target[columns] > 0]] = False
+        return pd.Series(predictions[unseen], index=pd.Index(movie_ids[unseen], name="movie_id"))
+
+    def predict_many(
+        self, user_ids: np.ndarray, targets: sparse.csr_matrix, neighbors: list[pd.Series] | None = None
+    ) -> np.ndarray:
+        """Row-wise :meth:`predict` for a block of users, given their rating rows ``targets``.
+
+        Returns a dense (users x movies) array over ``movie_ids``, seen movies
+        included. Only the block's rows are normalized (with the saved
+        ``row_norms``), so the base matrix is read in place, never copied.
+        """
+        width = len(self.movie_ids)
+        with self._lock:
+            matrix = self.matrix
+            delta_users, delta, delta_norms, shadowed = self._delta_state()
+            if neighbors is None:
+                target_norms = np.sqrt(np.asarray(targets.multiply(targets).sum(axis=1)).ravel())
+                scale = sparse.diags(np.divide(1.0, target_norms, out=np.zeros_like(target_norms), where=target_norms > 0))
+                base_scale = np.divide(1.0, self.row_norms, out=np.zeros_like(self.row_norms), where=self.row_norms > 0)
+                base_scale[shadowed] = 0.0
+                # matrix @ targets.T keeps the base in CSR; targets @ matrix.T would convert all of it.
+                base_sims = (scale @ (matrix @ targets[:, : matrix.shape[1]].T).T @ sparse.diags(base_scale)).tocsr()
+                delta_scale = np.divide(1.0, delta_norms, out=np.zeros_like(delta_norms), where=delta_norms > 0)
+                delta_sims = (scale @ (delta @ targets[:, : delta.shape[1]].T).T @ sparse.diags(delta_scale)).tocsr()
+                delta_lookup = {user_id: position for position, user_id in enumerate(delta_users)}
+                _zero_cells(base_sims, self.user_ids.get_indexer(user_ids))
+                _zero_cells(delta_sims, np.array([delta_lookup.get(user_id, -1) for user_id in user_ids.tolist()], dtype=np.int64))
+            else:
+                entries = [entry[entry.index != user_id] for user_id, entry in zip(user_ids.tolist(), neighbors)]
+                known = np.unique(np.concatenate([entry.index.to_numpy(dtype=np.int64) for entry in entries] + [np.zeros(0, dtype=np.int64)]))
+                base_positions, matrix, delta_positions, delta = self._rows(known.tolist())
+                columns = [np.searchsorted(known, entry.index.to_numpy(dtype=np.int64)) for entry in entries]
+                sims = sparse.csr_matrix(
+                    (
+                        np.concatenate([entry.to_numpy(dtype=np.float64) for entry in entries] + [np.zeros(0)]),
+                        np.concatenate(columns + [np.zeros(0, dtype=np.int64)]),
+                        np.concatenate([[0], np.cumsum([len(c) for c in columns])]),
+                    ),
+                    shape=(len(entries), len(known)),
+                )
+                base_sims, delta_sims = sims[:, base_positions], sims[:, delta_positions]
+
+        denominators = np.asarray(abs(base_sims).sum(axis=1)).ravel() + np.asarray(abs(delta_sims).sum(axis=1)).ravel()
+        predictions = np.zeros((len(user_ids), width))
+        predictions[:, : matrix.shape[1]] += (base_sims @ matrix).toarray()
+        predictions[:, : delta.shape[1]] += (delta_sims @ delta).toarray()
+        return np.divide(predictions, denominators[:, None], out=np.zeros_like(predictions), where=denominators[:, None] > 0)
+
+
+def _zero_cells(sims: sparse.csr_matrix, columns: np.ndarray) -> None:
+    """Zero each row's entry in its ``columns`` position (``-1``: none), e.g. a user's similarity to themself."""
+    row_columns = np.repeat(columns, np.diff(sims.indptr))
+    sims.data[(row_columns >= 0) & (sims.indices == row_columns)] = 0.0
+
+
+def _is_saved_model(path: Path) -> bool:
+    """Whether ``path`` is a directory written by :meth:`SmartRecommender.save`."""
+    try:
+        manifest = json.loads((path / "manifest.json").read_text())
+    except (OSError, ValueError):
+        return False
+    return isinstance(manifest, dict) and manifest.get("format") == MODEL_FORMAT
+
+
+def _normalize_rows(scores: np.ndarray) -> np.ndarray:
+    """Divide each row by its maximum where that maximum is positive."""
+    maxima = scores.max(axis=1, initial=0.0)
+    return np.divide(scores, maxima[:, None], out=scores.copy(), where=maxima[:, None] > 0)
+
+
+def _cosine_to(dots: np.ndarray, row_norms: np.ndarray, target_norm: float) -> np.ndarray:
+    norms = row_norms * target_norm
+    return np.divide(dots, norms, out=np.zeros_like(dots, dtype=np.float64), where=norms > 0)
+
+
+class ModelSnapshot:
+    """One consistent set of ratings-derived model state, replaced as a whole.
+
+    Its base structures (CSR matrix, neighbor lists, factors, popularity counts) are
+    never rebuilt in place; per-user writes are layered on under the structures' own locks.
+    """
+
+    def __init__(
+        self,
+        user_items: UserItemMatrix,
+        neighbor_index: NeighborIndex | None = None,
+        als: ALSModel | None = None,
+        version: str | None = None,
+        popularity: PopularityRanking | None = None,
+    ) -> None:
+        self.user_items = user_items
+        self.neighbor_index = neighbor_index
+        self.als = als
+        self.popularity = popularity
+        # Identifies the build; a saved model keeps it, so every worker mapping it agrees.
+        # Random unless the builder derives it from the inputs.
+        self.version = version or uuid.uuid4().hex[:12]
+
+
+class SmartRecommender:
+    def __init__(
+        self,
+        movies_path: str = "data/movies.csv",
+        ratings_path: str = "data/ratings.csv",
+        neighbor_k: int | None = None,
+        neighbor_mode: str = "exact",
+        backend: str = "user_cosine",
+        content_k: int | None = None,
+        cold_start_below: int = 1,
+        als_params: dict | None = None,
+    ) -> None:
+        self._configure(neighbor_k, neighbor_mode, backend, content_k, cold_start_below, als_params)
 
         # STEP 1: Build the TF-IDF matrix for all movie genres.
-        # Each movie becomes a vector in genre feature-space.
-        self.tfidf = TfidfVectorizer()
-        self.genre_matrix = self.tfidf.fit_transform(self.movies_df["genre_text"])
-
-    def build_user_ratings(self, user_id: int, app_ratings_df: pd.DataFrame | None = None) -> pd.DataFrame:
-        """Combine static seed ratings with in-app ratings for collaborative filtering."""
-        ratings = self.ratings_df.copy()
-        if app_ratings_df is not None and not app_ratings_df.empty:
-            ratings = pd.concat([ratings, app_ratings_df], ignore_index=True)
-
-        if user_id not in ratings["user_id"].values:
-            ratings = pd.concat(
-                [ratings, pd.DataFrame([{"user_id": user_id, "movie_id": -1, "rating": 0.0}])],
-                ignore_index=True,
+        # Each movie becomes a vector in genre feature-space. The fitted model comes
+        # from the precompiled catalog artifact when it matches movies.csv.
+        self._set_catalog(load_catalog(movies_path))
+        if content_k:
+            self.item_neighbors = ItemNeighborTable.load_or_build(
+                table_path_for(movies_path), self.normalized_genre_matrix, content_k
             )
-        return ratings[ratings["movie_id"] != -1]
+        self.seed_ratings = RatingsStore.read_csv(ratings_path)
+
+        # Live ratings state: seed ratings now, in-app ratings via bulk_load/upsert_rating.
+        self.bulk_load()
+
+    def _configure(
+        self,
+        neighbor_k: int | None,
+        neighbor_mode: str,
+        backend: str,
+        content_k: int | None = None,
+        cold_start_below: int = 1,
+        als_params: dict | None = None,
+    ) -> None:
+        if backend not in COLLAB_BACKENDS:
+            raise ValueError(f"backend must be one of {COLLAB_BACKENDS}, got {backend!r}")
+        # Collaborative engine: user-user cosine over the live matrix, or ALS factors.
+        self.backend = backend
+        # ALSModel keyword arguments (factors, regularization, alpha, iterations, seed) for the als backend.
+        self.als_params = ALSModel(**(als_params or {})).params()
+        # Optional top-K neighbor index (user_cosine only); None scores against every other user.
+        self.neighbor_k = neighbor_k
+        self.neighbor_mode = neighbor_mode
+        # Optional top-K item-item table for content scores; None scores against the whole catalog.
+        self.content_k = content_k
+        self.item_neighbors: ItemNeighborTable | None = None
+        # Users with fewer ratings than this get the popularity ranking instead of hybrid scores.
+        self.cold_start_below = cold_start_below
+        # Writes are serialized; while refresh() rebuilds they are also journaled for replay.
+        self._write_lock = threading.Lock()
+        self._journal: list | None = None
+        # Directory of the saved model this instance was loaded from, if any.
+        self.loaded_from: Path | None = None
+
+    def _set_catalog(self, catalog: Catalog) -> None:
+        self.movies_df = catalog.movies_df
+        self.tfidf = catalog.tfidf
+        self.genre_matrix = catalog.genre_matrix
+        self.normalized_genre_matrix = normalize(self.genre_matrix)
+        # Catalog position of every movie_id, built once instead of per request.
+        self.movie_index = pd.Index(self.movies_df["movie_id"])
+
+    def save(self, path: str | Path) -> Path:
+        """Write the catalog, seed ratings and current model snapshot under ``path``.
+
+        Each large array is its own ``.npy`` so :meth:`load` can memory-map it. The
+        files go into a fresh ``<path>-<model version>`` directory and ``path`` is
+        then re-pointed at it with an atomic symlink swap; returns that directory.
+        Raises ``ValueError`` rather than replace a ``path`` that is not a saved model.
+        """
+        path = Path(path)
+        # Only directories holding a saved model are ever replaced or removed.
+        if path.exists() and not path.is_symlink() and not _is_saved_model(path):
+            raise ValueError(f"{path} exists and is not a saved model; refusing to replace it")
+        snapshot = self._snapshot
+        target = path.with_name(f"{path.name}-{snapshot.version}")
+        if target.exists() and not _is_saved_model(target):
+            raise ValueError(f"{target} exists and is not a saved model; refusing to replace it")
+        user_items = snapshot.user_items
+        if user_items.has_overrides:
+            user_items = UserItemMatrix(user_items.to_store())
+        matrix = user_items.matrix
+        arrays = {
+            "seed_user_ids": self.seed_ratings.user_ids,
+            "seed_indptr": self.seed_ratings.indptr,
+            "seed_movie_codes": self.seed_ratings.movie_codes,
+            "seed_ratings": self.seed_ratings.ratings,
+            "seed_movie_ids": self.seed_ratings.movie_ids,
+            "matrix_data": matrix.data,
+            "matrix_indices": matrix.indices,
+            "matrix_indptr": matrix.indptr,
+            "matrix_user_ids": user_items.user_ids.to_numpy(),
+            "matrix_movie_ids": user_items.movie_ids,
+        }
+        manifest = {
+            "format": MODEL_FORMAT,
+            "version": MODEL_FORMAT_VERSION,
+            "model_version": snapshot.version,
+            "saved_at": time.time(),
+            "backend": self.backend,
+            "neighbor_k": self.neighbor_k,
+            "neighbor_mode": self.neighbor_mode,
+            "content_k": self.content_k,
+            "cold_start_below": self.cold_start_below,
+            "als_params": self.als_params,
+            "matrix_shape": list(matrix.shape),
+        }
+        if snapshot.neighbor_index is not None:
+            index = snapshot.neighbor_index
+            neighbor_arrays = index.arrays()
+            arrays.update({f"neighbors_{name}": values for name, values in neighbor_arrays.items()})
+            manifest["neighbors"] = {
+                "arrays": sorted(neighbor_arrays),
+                "k": index.k,
+                "mode": index.mode,
+                "n_tables": index.n_tables,
+                "n_bits": index.n_bits,
+                "seed": index.seed,
+                "block_size": index.block_size,
+            }
+        if snapshot.popularity is not None:
+            arrays["popularity_counts"] = snapshot.popularity.counts
+            arrays["popularity_sums"] = snapshot.popularity.sums
+            manifest["popularity"] = {
+                "prior_votes": snapshot.popularity.prior_votes,
+                "prior_mean": snapshot.popularity.prior_mean,
+            }
+        if self.item_neighbors is not None:
+            arrays["item_neighbor_positions"] = self.item_neighbors.positions
+            arrays["item_neighbor_sims"] = self.item_neighbors.sims
+        if snapshot.als is not None:
+            arrays["als_item_ids"] = snapshot.als.item_ids
+            arrays["als_item_factors"] = snapshot.als.item_factors
+            manifest["als"] = snapshot.als.params()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(dir=path.parent, prefix=f".{path.name}-"))
+        try:
+            for name, values in arrays.items():
+                np.save(staging / f"{name}.npy", np.asarray(values))
+            save_catalog(Catalog(self.movies_df, self.genre_matrix, self.tfidf), staging / "catalog.npz")
+            (staging / "manifest.json").write_text(json.dumps(manifest, indent=2))
+            staging.chmod(0o755)
+            if target.exists():
+                shutil.rmtree(target)
+            staging.rename(target)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        previous = path.resolve() if path.is_symlink() else None
+        if path.exists() and not path.is_symlink():
+            shutil.rmtree(path)
+        link = path.with_name(f".{path.name}.link-{os.getpid()}")
+        link.unlink(missing_ok=True)
+        link.symlink_to(target.name)
+        os.replace(link, path)
+        # Processes still mapping the old files keep them until they exit. A link
+        # pointing somewhere save() did not write is left alone.
+        if (
+            previous is not None
+            and previous != target.resolve()
+            and previous.parent == target.resolve().parent
+            and previous.name.startswith(f"{path.name}-")
+            and _is_saved_model(previous)
+        ):
+            shutil.rmtree(previous, ignore_errors=True)
+        return target
+
+    @classmethod
+    def load(cls, path: str | Path, mmap: bool = True) -> SmartRecommender:
+        """Restore a model written by :meth:`save` without refitting anything.
+
+        With ``mmap`` the large arrays are memory-mapped, so processes loading the
+        same model share its pages. Neighbor lists are mapped copy-on-write because
+        rating updates patch them in place.
+        """
+        path = Path(path).resolve()
+        manifest = json.loads((path / "manifest.json").read_text())
+        if manifest.get("format") != MODEL_FORMAT or manifest.get("version") != MODEL_FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {MODEL_FORMAT_VERSION} {MODEL_FORMAT} directory")
+        catalog = read_catalog(path / "catalog.npz")
+        if catalog is None:
+            raise ValueError(f"{path} has no readable catalog")
+
+        def array(name: str, mode: str = "r") -> np.ndarray:
+            return np.load(path / f"{name}.npy", mmap_mode=mode if mmap else None)
+
+        recommender = cls.__new__(cls)
+        recommender._configure(
+            manifest["neighbor_k"],
+            manifest["neighbor_mode"],
+            manifest["backend"],
+            manifest.get("content_k"),
+            manifest.get("cold_start_below", 1),
+            manifest.get("als_params"),
+        )
+        recommender._set_catalog(catalog)
+        if recommender.content_k:
+            item_neighbors = ItemNeighborTable(recommender.normalized_genre_matrix, recommender.content_k)
+            item_neighbors.positions = array("item_neighbor_positions")
+            item_neighbors.sims = array("item_neighbor_sims")
+            recommender.item_neighbors = item_neighbors
+        recommender.seed_ratings = RatingsStore(
+            array("seed_user_ids"), array("seed_indptr"), array("seed_movie_codes"), array("seed_ratings"), array("seed_movie_ids")
+        )
+        matrix = sparse.csr_matrix(
+            (array("matrix_data"), array("matrix_indices"), array("matrix_indptr")), shape=tuple(manifest["matrix_shape"])
+        )
+        user_items = UserItemMatrix.from_csr(matrix, array("matrix_user_ids"), array("matrix_movie_ids"))
+
+        neighbor_index = None
+        if "neighbors" in manifest:
+            options = dict(manifest["neighbors"])
+            names = options.pop("arrays")
+            neighbor_index = NeighborIndex.from_arrays(
+                user_items, {name: array(f"neighbors_{name}", "c") for name in names}, **options
+            )
+        als = None
+        if "als" in manifest:
+            als = ALSModel(**manifest["als"]).set_factors(array("als_item_ids"), array("als_item_factors"))
+        popularity = None
+        if "popularity" in manifest:
+            # Copy-on-write: rating writes update the counts in place.
+            popularity = PopularityRanking(
+                catalog.movies_df, array("popularity_counts", "c"), array("popularity_sums", "c"), **manifest["popularity"]
+            )
+        recommender._snapshot = ModelSnapshot(
+            user_items, neighbor_index, als, version=manifest["model_version"], popularity=popularity
+        )
+        recommender.loaded_from = path
+        return recommender
+
+    @property
+    def model_version(self) -> str:
+        return self._snapshot.version
+
+    @property
+    def user_items(self) -> UserItemMatrix:
+        return self._snapshot.user_items
+
+    @property
+    def neighbor_index(self) -> NeighborIndex | None:
+        return self._snapshot.neighbor_index
+
+    @property
+    def als(self) -> ALSModel | None:
+        return self._snapshot.als
+
+    def build_snapshot(self, app_ratings: RatingsStore | None = None) -> ModelSnapshot:
+        """Build the ratings-derived model state from the seed ratings plus in-app ratings.
+
+        In-app ratings override a seed rating for the same (user, movie) pair. Nothing
+        shared is touched, so this can run in any thread.
+        """
+        ratings = self.seed_ratings if app_ratings is None else self.seed_ratings.overlay(app_ratings)
+        return self._snapshot_from(ratings)
+
+    def _snapshot_from(self, ratings: RatingsStore) -> ModelSnapshot:
+        user_items = UserItemMatrix(ratings)
+        version = self._model_version(ratings)
+        popularity = PopularityRanking.from_store(ratings, self.movies_df)
+        if self.backend == "als":
+            return ModelSnapshot(user_items, als=ALSModel(**self.als_params).fit(ratings), version=version, popularity=popularity)
+        if self.neighbor_k:
+            index = NeighborIndex(user_items, k=self.neighbor_k, mode=self.neighbor_mode)
+            return ModelSnapshot(user_items, index, version=version, popularity=popularity)
+        return ModelSnapshot(user_items, version=version, popularity=popularity)
+
+    def _model_version(self, ratings: RatingsStore) -> str:
+        """Digest of the inputs a build depends on, so workers building the same model agree on its version."""
+        digest = hashlib.blake2b(digest_size=6)
+        config = (self.backend, self.neighbor_k, self.neighbor_mode, self.content_k, self.cold_start_below)
+        if self.backend == "als":
+            config += (sorted(self.als_params.items()),)
+        digest.update(repr(config).encode())
+        digest.update(np.ascontiguousarray(self.movie_index.to_numpy()).tobytes())
+        for array in (ratings.user_ids, ratings.indptr, ratings.movie_codes, ratings.ratings, ratings.movie_ids):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()
+
+    def bulk_load(self, app_ratings: RatingsStore | None = None) -> None:
+        """Replace the live state with one built from the seed plus ``app_ratings``."""
+        snapshot = self.build_snapshot(app_ratings)
+        with self._write_lock:
+            self._snapshot = snapshot
+
+    def refresh(self, load_app_ratings: Callable[[], RatingsStore | None]) -> None:
+        """Rebuild the state off the request path and atomically swap it in.
+
+        Requests keep using the current snapshot meanwhile. Writes made after the
+        journal opens are replayed onto the new snapshot before the swap, so none
+        are lost even if ``load_app_ratings`` read the database before them.
+        """
+        self._rebuild(lambda: self.build_snapshot(load_app_ratings()))
+
+    @property
+    def needs_compaction(self) -> bool:
+        """Whether overrides piled up or too many neighbor slots were freed by writes."""
+        snapshot = self._snapshot
+        index = snapshot.neighbor_index
+        return snapshot.user_items.needs_compaction or (index is not None and index.needs_rebuild)
+
+    def compact(self) -> None:
+        """Rebuild the snapshot from its own current ratings, folding per-user overrides into the base.
+
+        Like :meth:`refresh` this runs off the request path (the refresher thread
+        calls it) and swaps the result in; it just skips re-reading the database.
+        """
+        self._rebuild(lambda: self._snapshot_from(self._snapshot.user_items.to_store()))
+
+    def _rebuild(self, build: Callable[[], ModelSnapshot]) -> None:
+        with self._write_lock:
+            self._journal = []
+        try:
+            snapshot = build()
+        except BaseException:
+            with self._write_lock:
+                self._journal = None
+            raise
+        with self._write_lock:
+            for user_id, change in self._journal:
+                self._apply(snapshot, user_id, change)
+            self._journal = None
+            self._snapshot = snapshot
+
+    def upsert_rating(self, user_id: int, movie_id: int, rating: float) -> None:
+        """Apply one in-app rating to the live state."""
+
+        def change(user_items: UserItemMatrix) -> bool:
+            user_items.set_rating(user_id, movie_id, rating)
+            return True
+
+        self._write(user_id, change)
+
+    def delete_user_ratings(self, user_id: int) -> None:
+        """Drop a user's in-app ratings, falling back to their seed ratings (if any)."""
+        seed = self._seed_ratings(user_id)
+
+        def change(user_items: UserItemMatrix) -> bool:
+            user_items.set_user(user_id, seed)
+            return True
+
+        self._write(user_id, change)
+
+    def sync_user_ratings(self, user_id: int, ratings: dict[int, float]) -> None:
+        """Reset a user to their seed ratings plus the given in-app ratings."""
+        merged = self._seed_ratings(user_id)
+        merged.update(ratings)
+
+        def change(user_items: UserItemMatrix) -> bool:
+            if merged == user_items.ratings_for(user_id):
+                return False
+            user_items.set_user(user_id, merged)
+            return True
+
+        self._write(user_id, change)
+
+    def _write(self, user_id: int, change: Callable[[UserItemMatrix], bool]) -> None:
+        with self._write_lock:
+            if self._apply(self._snapshot, user_id, change) and self._journal is not None:
+                self._journal.append((user_id, change))
+
+    @staticmethod
+    def _apply(snapshot: ModelSnapshot, user_id: int, change: Callable[[UserItemMatrix], bool]) -> bool:
+        before = snapshot.user_items.ratings_for(user_id) if snapshot.popularity is not None else None
+        changed = change(snapshot.user_items)
+        if changed and snapshot.neighbor_index is not None:
+            snapshot.neighbor_index.update_user(user_id)
+        if changed and snapshot.popularity is not None:
+            snapshot.popularity.update(before, snapshot.user_items.ratings_for(user_id))
+        return changed
+
+    def _seed_ratings(self, user_id: int) -> dict[int, float]:
+        return self.seed_ratings.user_ratings(user_id)
 
     def _content_scores(self, rated_movie_ids: list[int], rated_values: list[float]) -> pd.Series:
         """STEP 2: Content-Based Filtering.
 
-        Compute cosine similarity between user-liked movies and every movie, then
-        weight each similarity by the user's normalized rating.
+        Fold the user's rated movies into one weighted genre profile (each movie
+        weighted by the user's normalized rating), then score every movie with a
+        single product against the L2-normalized genre matrix. This equals summing
+        per-movie cosine similarities, but costs the same for 5 or 500 ratings.
+
+        With ``content_k`` only each rated movie's top-K most similar movies are
+        summed instead, so large catalogs are never scanned per request.
         """
-        movie_index = {mid: idx for idx, mid in enumerate(self.movies_df["movie_id"].tolist())}
-        scores = np.zeros(len(self.movies_df))
+        positions = self.movie_index.get_indexer(rated_movie_ids)
+        weights = np.clip(np.asarray(rated_values, dtype=np.float64) / 5.0, 0.0, 1.0)
+        known = positions >= 0
 
-        for movie_id, rating in zip(rated_movie_ids, rated_values):
-            if movie_id not in movie_index:
-                continue
-            idx = movie_index[movie_id]
-            sim = cosine_similarity(self.genre_matrix[idx], self.genre_matrix).flatten()
-            weight = max(0.0, min(1.0, rating / 5.0))
-            scores += sim * weight
+        if self.item_neighbors is not None:
+            # Only the rated movies' neighbor lists: O(ratings x K) whatever the catalog size.
+            neighbors = self.item_neighbors.positions[positions[known]]
+            contributions = weights[known][:, None] * self.item_neighbors.sims[positions[known]]
+            filled = neighbors >= 0
+            scores = np.zeros(len(self.movies_df))
+            np.add.at(scores, neighbors[filled], contributions[filled])
+        else:
+            movie_weights = np.zeros(len(self.movies_df))
+            np.add.at(movie_weights, positions[known], weights[known])
+
+            profile = self.normalized_genre_matrix.T @ movie_weights
+            scores = self.normalized_genre_matrix @ profile
 
         if scores.max() > 0:
             scores = scores / scores.max()
 
-        return pd.Series(scores, index=self.movies_df["movie_id"])
+        return pd.Series(scores, index=self.movie_index)
 
-    def _collab_scores(self, user_id: int, merged_ratings: pd.DataFrame) -> pd.Series:
+    def _collab_scores(self, user_id: int, snapshot: ModelSnapshot | None = None) -> pd.Series:
         """STEP 3: Collaborative Filtering.
 
-        Build a user-item matrix, compute user-user cosine similarity, then infer
-        scores for unseen movies from similar users' ratings.
+        Use the live sparse user-item matrix to compute the target user's cosine
+        similarity to every other user with one sparse product, then infer scores
+        for all unseen movies from similar users' ratings in one vectorized step.
+        With a neighbor index only the user's top-K neighbors are aggregated. The
+        "als" backend instead scores unseen movies from the user's folded-in factor.
         """
-        user_item = merged_ratings.pivot_table(index="user_id", columns="movie_id", values="rating", fill_value=0)
-
-        if user_id not in user_item.index:
+        snapshot = snapshot or self._snapshot
+        if snapshot.als is not None:
+            scores = snapshot.als.scores(snapshot.user_items.ratings_for(user_id))
+            scores = scores.clip(lower=0.0) if scores is not None else None
+        else:
+            neighbors = snapshot.neighbor_index.neighbors(user_id) if snapshot.neighbor_index is not None else None
+            scores = snapshot.user_items.predict(user_id, neighbors)
+        if scores is None:
             return pd.Series(0.0, index=self.movies_df["movie_id"])
 
-        sim_matrix = cosine_similarity(user_item)
-        sim_df = pd.DataFrame(sim_matrix, index=user_item.index, columns=user_item.index)
-        neighbors = sim_df.loc[user_id].drop(user_id)
-
-        pred_scores: dict[int, float] = {}
-        for movie_id in user_item.columns:
-            if user_item.loc[user_id, movie_id] > 0:
-                continue
-
-            movie_ratings = user_item[movie_id]
-            numerator = float((neighbors * movie_ratings).sum())
-            denominator = float(np.abs(neighbors).sum())
-            pred_scores[movie_id] = numerator / denominator if denominator > 0 else 0.0
-
-        scores = pd.Series(pred_scores)
         if scores.empty:
             return pd.Series(0.0, index=self.movies_df["movie_id"])
         if scores.max() > 0:
@@ -94,26 +821,130 @@ class SmartRecommender:
 
         return scores.reindex(self.movies_df["movie_id"], fill_value=0.0)
 
-    def recommend(self, user_id: int, app_ratings_df: pd.DataFrame, top_n: int = 10) -> pd.DataFrame:
+    def recommend(self, user_id: int, top_n: int = 10) -> pd.DataFrame:
         """STEP 4: Hybrid recommendation.
 
         final_score = 0.5 * content_score + 0.5 * collaborative_score
         """
-        merged_ratings = self.build_user_ratings(user_id, app_ratings_df)
-        user_ratings = merged_ratings[merged_ratings["user_id"] == user_id]
+        snapshot = self._snapshot
+        user_ratings = snapshot.user_items.ratings_for(user_id)
 
-        if user_ratings.empty:
-            fallback = self.movies_df.copy()
-            fallback["score"] = 0.0
-            return fallback.head(top_n)
+        if len(user_ratings) < self.cold_start_below:
+            return self._cold_start(snapshot, user_ratings, top_n)
 
-        content = self._content_scores(user_ratings["movie_id"].tolist(), user_ratings["rating"].tolist())
-        collab = self._collab_scores(user_id, merged_ratings)
+        with timed("recommend.content"):
+            content = self._content_scores(list(user_ratings), list(user_ratings.values()))
+        with timed("recommend.collab"):
+            collab = self._collab_scores(user_id, snapshot)
+        with timed("recommend.merge"):
+            return self._merge_scores(content, collab, set(user_ratings), top_n)
 
+    def _merge_scores(self, content: pd.Series, collab: pd.Series, watched_ids: set[int], top_n: int) -> pd.DataFrame:
+        """Blend both score series and keep the top unseen movies (ties in catalog order)."""
         hybrid = (0.5 * content) + (0.5 * collab)
 
-        watched_ids = set(user_ratings["movie_id"].tolist())
         results = self.movies_df[~self.movies_df["movie_id"].isin(watched_ids)].copy()
         results["score"] = results["movie_id"].map(hybrid).fillna(0.0)
-        results = results.sort_values("score", ascending=False).head(top_n)
+        results = results.sort_values("score", ascending=False, kind="stable").head(top_n)
+        return results
+
+    def popular(self, top_n: int = 10, genre: str | None = None, year: str | None = None) -> pd.DataFrame:
+        """Top-ranked movies by Bayesian-average rating, optionally within one genre and/or year.
+
+        Scores are 0: the ranking is not personal, so there is no match score to show.
+        """
+        positions = self._snapshot.popularity.top(top_n, genre=genre, year=year)
+        frame = self.movies_df.iloc[positions].copy()
+        frame["score"] = 0.0
+        return frame
+
+    def _cold_start(self, snapshot: ModelSnapshot, user_ratings: dict[int, float], top_n: int) -> pd.DataFrame:
+        """The popularity ranking minus the user's rated movies: an O(top_n) lookup."""
+        frame = self.movies_df.iloc[snapshot.popularity.top(top_n, exclude=set(user_ratings))].copy()
+        frame["score"] = 0.0
+        return frame
+
+    def movies_with_scores(self, movie_ids: list[int], scores: list[float]) -> pd.DataFrame:
+        """Catalog rows for ``movie_ids`` (in that order) with a ``score`` column, as ``recommend`` returns."""
+        positions = self.movie_index.get_indexer(movie_ids)
+        found = positions >= 0
+        frame = self.movies_df.iloc[positions[found]].copy()
+        frame["score"] = np.asarray(scores, dtype=np.float64)[found]
+        return frame
+
+    def recommend_many(self, user_ids: list[int], top_n: int = 10, block_size: int = 256) -> dict[int, pd.DataFrame]:
+        """Batch version of :meth:`recommend`, scoring ``block_size`` users per matrix product.
+
+        Returns the same frames ``recommend`` would, keyed by user id.
+        """
+        results: dict[int, pd.DataFrame] = {}
+        snapshot = self._snapshot
+        user_items = snapshot.user_items
+        catalog_columns = pd.Index(user_items.movie_ids).get_indexer(self.movie_index)
+
+        for start in range(0, len(user_ids), block_size):
+            # Only the block's rows are read: pool workers share the mmapped matrix.
+            block = pd.unique(np.asarray(user_ids[start : start + block_size], dtype=np.int64))
+            ids, vectors = user_items.vectors(block.tolist())
+            rows = pd.Index(ids).get_indexer(block)
+            cold = rows < 0
+            rated_counts = np.asarray((vectors[rows[~cold]] > 0).sum(axis=1)).ravel()
+            cold[~cold] = rated_counts < self.cold_start_below
+            for user_id in block[cold].tolist():
+                results[user_id] = self._cold_start(snapshot, user_items.ratings_for(user_id), top_n)
+            block, rows = block[~cold], rows[~cold]
+            if not len(block):
+                continue
+
+            targets = vectors[rows]
+            content = self._content_scores_many(snapshot, targets)
+            collab = self._collab_scores_many(snapshot, block, targets)
+            catalog_collab = np.where(catalog_columns >= 0, collab[:, np.maximum(catalog_columns, 0)], 0.0)
+            hybrid = (0.5 * content) + (0.5 * catalog_collab)
+
+            watched = targets[:, np.maximum(catalog_columns, 0)].toarray() > 0
+            watched &= catalog_columns >= 0
+            for position, user_id in enumerate(block.tolist()):
+                unseen = np.flatnonzero(~watched[position])
+                order = unseen[np.argsort(-hybrid[position, unseen], kind="stable")[:top_n]]
+                frame = self.movies_df.iloc[order].copy()
+                frame["score"] = hybrid[position, order]
+                results[user_id] = frame
         return results
+
+    def _content_scores_many(self, snapshot: ModelSnapshot, targets: sparse.csr_matrix) -> np.ndarray:
+        """Row-wise :meth:`_content_scores` for a block of users' rating rows."""
+        movie_ids = snapshot.user_items.movie_ids[: targets.shape[1]]
+        catalog_positions = self.movie_index.get_indexer(movie_ids)
+        known = np.flatnonzero(catalog_positions >= 0)
+        weights = targets[:, known].tocoo()
+        movie_weights = sparse.csr_matrix(
+            (np.clip(weights.data / 5.0, 0.0, 1.0), (weights.row, catalog_positions[known][weights.col])),
+            shape=(targets.shape[0], len(self.movies_df)),
+        )
+        if self.item_neighbors is not None:
+            return _normalize_rows(self.item_neighbors.scores(movie_weights))
+        profiles = movie_weights @ self.normalized_genre_matrix
+        scores = np.asarray((profiles @ self.normalized_genre_matrix.T).todense())
+        return _normalize_rows(scores)
+
+    def _collab_scores_many(self, snapshot: ModelSnapshot, user_ids: np.ndarray, targets: sparse.csr_matrix) -> np.ndarray:
+        """Row-wise collaborative predictions (user-item column space) for a block of users."""
+        if snapshot.als is not None:
+            return self._als_scores_many(snapshot, user_ids, targets)
+        neighbors = None
+        if snapshot.neighbor_index is not None:
+            neighbors = [snapshot.neighbor_index.neighbors(user_id) for user_id in user_ids.tolist()]
+        predictions = snapshot.user_items.predict_many(user_ids, targets, neighbors)
+        predictions[targets.toarray() > 0] = 0.0
+        return _normalize_rows(predictions)
+
+    def _als_scores_many(self, snapshot: ModelSnapshot, user_ids: np.ndarray, targets: sparse.csr_matrix) -> np.ndarray:
+        """Row-wise ALS scores (user-item column space, negatives clipped) for a block of users."""
+        als, user_items = snapshot.als, snapshot.user_items
+        factors = np.vstack([als.user_factor(user_items.ratings_for(user_id)) for user_id in user_ids.tolist()])
+        columns = pd.Index(als.item_ids).get_indexer(user_items.movie_ids[: targets.shape[1]])
+        scores = np.where(columns >= 0, (factors @ als.item_factors.T)[:, np.maximum(columns, 0)], 0.0)
+        scores = np.clip(scores, 0.0, None)
+        scores[targets.toarray() > 0] = 0.0
+        return _normalize_rows(scores)
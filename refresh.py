@@ -0,0 +1,107 @@
+"""Background model refresh for SmartRecs.
+
+A daemon thread rebuilds the recommender's model snapshot from the database on
+a schedule and/or once enough ratings have changed (in any worker, as counted
+in SQLite), then swaps it in atomically via :meth:`SmartRecommender.refresh`.
+The same thread compacts the live model once per-user rating overrides pile up
+or writes have emptied too many neighbor slots (:meth:`SmartRecommender.compact`).
+Requests never wait on a rebuild.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Callable
+
+from metrics import timed
+from ratings import RatingsStore
+from recommender import SmartRecommender
+
+logger = logging.getLogger(__name__)
+
+POLL_SECONDS = 30.0
+
+
+class ModelRefresher:
+    """Rebuild ``recommender`` every ``interval`` seconds and/or after ``after_changes`` rating writes.
+
+    ``change_count`` returns a counter that grows with every rating write;
+    ``0`` disables the corresponding trigger. The thread runs even with both
+    disabled, to compact the model when it needs it.
+    """
+
+    def __init__(
+        self,
+        recommender: SmartRecommender,
+        load_ratings: Callable[[], RatingsStore],
+        change_count: Callable[[], int],
+        interval: float = 0.0,
+        after_changes: int = 0,
+        poll_seconds: float = POLL_SECONDS,
+    ) -> None:
+        self.recommender = recommender
+        self.load_ratings = load_ratings
+        self.change_count = change_count
+        self.interval = interval
+        self.after_changes = after_changes
+        self.poll_seconds = min(poll_seconds, interval) if interval else poll_seconds
+        self._last_refresh = time.monotonic()
+        self._last_count: int | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether scheduled refreshes are on (compaction always is)."""
+        return bool(self.interval or self.after_changes)
+
+    def ensure_started(self) -> None:
+        """Start the thread in this process if needed (threads do not survive a fork)."""
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="model-refresh", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def due(self) -> bool:
+        if self.interval and time.monotonic() - self._last_refresh >= self.interval:
+            return True
+        if self.after_changes:
+            if self._last_count is None:
+                self._last_count = self.change_count()
+            return self.change_count() - self._last_count >= self.after_changes
+        return False
+
+    def refresh_now(self) -> None:
+        # Count first: writes landing during the rebuild count towards the next one.
+        count = self.change_count() if self.after_changes else None
+        with timed("model.refresh"):
+            self.recommender.refresh(self.load_ratings)
+        self._last_refresh = time.monotonic()
+        self._last_count = count
+
+    def compact_now(self) -> None:
+        with timed("model.compact"):
+            self.recommender.compact()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                # A refresh rebuilds from scratch, so it compacts too.
+                if self.due():
+                    self.refresh_now()
+                elif self.recommender.needs_compaction:
+                    self.compact_now()
+            except Exception:
+                logger.exception("Model refresh failed; keeping the current snapshot")
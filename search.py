@@ -0,0 +1,125 @@
+"""Prebuilt catalog search index for SmartRecs filters.
+
+Answers the Rate/Recommendations filters (title substring, exact year, genre
+substring) by intersecting postings lists instead of scanning every movie.
+Substring lookups use 1- to 3-gram postings and are verified against the text,
+so results are exactly those of a linear ``needle in text`` scan.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+MAX_GRAM = 3
+
+
+class SubstringIndex:
+    """n-gram postings over a list of lowercase texts.
+
+    Postings are kept per distinct text, so repetitive columns such as genre
+    strings index a few hundred values rather than every movie.
+    """
+
+    def __init__(self, texts: list[str]) -> None:
+        codes, uniques = pd.factorize(pd.Index(texts, dtype=object))
+        self.texts: list[str] = uniques.tolist()
+        order = np.argsort(codes, kind="stable").astype(np.int32)
+        self._distinct = len(self.texts) == len(texts)
+        self._order = order
+        self._positions = np.split(order, np.flatnonzero(np.diff(codes[order])) + 1) if len(order) else []
+        grams: list[str] = []
+        owners: list[int] = []
+        for text_id, text in enumerate(self.texts):
+            distinct = {text[i : i + n] for n in range(1, MAX_GRAM + 1) for i in range(len(text) - n + 1)}
+            grams.extend(distinct)
+            owners.extend([text_id] * len(distinct))
+        self.postings = _group_positions(grams, np.asarray(owners, dtype=np.int32))
+
+    def lookup(self, needle: str) -> np.ndarray:
+        """Sorted positions of the texts containing ``needle``."""
+        if len(needle) <= MAX_GRAM:
+            return self._expand(self.postings.get(needle, _EMPTY))
+        grams = {needle[i : i + MAX_GRAM] for i in range(len(needle) - MAX_GRAM + 1)}
+        lists = sorted((self.postings.get(gram, _EMPTY) for gram in grams), key=len)
+        candidates = lists[0]
+        for postings in lists[1:]:
+            if not len(candidates):
+                break
+            candidates = np.intersect1d(candidates, postings, assume_unique=True)
+        return self._expand([text_id for text_id in candidates.tolist() if needle in self.texts[text_id]])
+
+    def _expand(self, text_ids) -> np.ndarray:
+        """Positions of every row holding one of ``text_ids``."""
+        if len(text_ids) == 0:
+            return _EMPTY
+        if self._distinct:
+            return np.sort(self._order[np.asarray(text_ids)])
+        return np.sort(np.concatenate([self._positions[text_id] for text_id in text_ids]))
+
+
+class CatalogFilterIndex:
+    """Year and genre postings for a catalog: the filters without the title search."""
+
+    def __init__(self, movies_df: pd.DataFrame) -> None:
+        self.movie_ids = movies_df["movie_id"].to_numpy()
+        genres = movies_df["genres"].fillna("").astype(str).str.replace("|", ",", regex=False).str.lower()
+        years = movies_df["year"].fillna("").astype(str)
+        self.genres = SubstringIndex(genres.tolist())
+        self.years = _group_positions(years.tolist(), np.arange(len(years), dtype=np.int32))
+
+    def filter(self, year: str, genre: str) -> np.ndarray:
+        """Catalog positions (ascending) of the given year and genre substring; blank filters match everything."""
+        return self._intersect(self._filter_lists(year, genre))
+
+    def _filter_lists(self, year: str, genre: str) -> list[np.ndarray]:
+        year_filter = (year or "").strip()
+        genre_filter = (genre or "").strip().lower()
+        lists = []
+        if year_filter:
+            lists.append(self.years.get(year_filter, _EMPTY))
+        if genre_filter:
+            lists.append(self.genres.lookup(genre_filter))
+        return lists
+
+    def _intersect(self, lists: list[np.ndarray]) -> np.ndarray:
+        if not lists:
+            return np.arange(len(self.movie_ids), dtype=np.int32)
+        lists.sort(key=len)
+        positions = lists[0]
+        for postings in lists[1:]:
+            positions = np.intersect1d(positions, postings, assume_unique=True)
+        return positions
+
+
+class CatalogSearchIndex(CatalogFilterIndex):
+    """Title, year and genre postings for a catalog, built once at load time."""
+
+    def __init__(self, movies_df: pd.DataFrame) -> None:
+        super().__init__(movies_df)
+        titles = movies_df["clean_title"].fillna(movies_df["title"]).astype(str).str.lower()
+        self.titles = SubstringIndex(titles.tolist())
+
+    def search(self, query: str, year: str, genre: str) -> np.ndarray:
+        """Catalog positions (ascending) matching the filters; blank filters match everything."""
+        search = (query or "").strip().lower()
+        lists = self._filter_lists(year, genre)
+        if search:
+            lists.append(self.titles.lookup(search))
+        return self._intersect(lists)
+
+    def matching_ids(self, query: str, year: str, genre: str) -> set[int]:
+        return set(self.movie_ids[self.search(query, year, genre)].tolist())
+
+
+_EMPTY = np.zeros(0, dtype=np.int32)
+
+
+def _group_positions(keys: list[str], positions: np.ndarray) -> dict[str, np.ndarray]:
+    """Map each distinct key to the sorted positions it occurs at."""
+    if not len(keys):
+        return {}
+    codes, uniques = pd.factorize(pd.Index(keys))
+    order = np.argsort(codes, kind="stable")
+    boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+    groups = np.split(positions[order], boundaries)
+    return {key: np.sort(group) for key, group in zip(uniques.tolist(), groups)}
@@ -0,0 +1,9 @@
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# The app resolves data/ relative to the working directory.
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)
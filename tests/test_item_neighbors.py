@@ -0,0 +1,89 @@
+"""Extending an item neighbor table must give the table a full rebuild would."""
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+from catalog import load_catalog
+from item_neighbors import ItemNeighborTable
+
+GENRES = ["Action", "Adventure", "Animation", "Comedy", "Crime", "Drama", "Horror", "Romance", "Thriller"]
+
+
+def genre_lists(count, seed=0):
+    # Genre combinations repeat, so similarity ties (broken by catalog position) are everywhere.
+    rng = np.random.default_rng(seed)
+    return [list(rng.choice(GENRES, size=rng.integers(1, 4), replace=False)) for _ in range(count)]
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    # Larger than one 256-row block.
+    genre_texts = [" ".join(genres) for genres in genre_lists(700)]
+    return normalize(TfidfVectorizer().fit_transform(genre_texts).tocsr())
+
+
+@pytest.mark.parametrize("prefix", [0, 1, 255, 256, 300, 699])
+def test_extend_matches_build(vectors, prefix):
+    full = ItemNeighborTable.build(vectors, k=20)
+    extended = ItemNeighborTable.build(vectors[:prefix], k=20).extend(vectors)
+
+    np.testing.assert_array_equal(extended.positions, full.positions)
+    np.testing.assert_allclose(extended.sims, full.sims)
+
+
+def test_extend_in_steps_matches_build(vectors):
+    full = ItemNeighborTable.build(vectors, k=20)
+    table = ItemNeighborTable.build(vectors[:100], k=20)
+    for end in (350, 351, 600, 700):
+        table.extend(vectors[:end])
+
+    np.testing.assert_array_equal(table.positions, full.positions)
+    np.testing.assert_allclose(table.sims, full.sims)
+
+
+def write_movies(path, genres, start=0):
+    frame = pd.DataFrame(
+        {
+            "movie_id": range(start + 1, start + len(genres) + 1),
+            "title": [f"Movie {start + i} (2001)" for i in range(len(genres))],
+            "genres": ["|".join(names) for names in genres],
+        }
+    )
+    frame.to_csv(path, mode="a" if start else "w", header=not start, index=False)
+
+
+def test_load_or_build_extends_after_movies_are_appended(tmp_path, monkeypatch):
+    movies_path, table_path = tmp_path / "movies.csv", tmp_path / "item_neighbors.npz"
+    genres = genre_lists(730)
+    write_movies(movies_path, genres[:700])
+    before = load_catalog(movies_path)
+    ItemNeighborTable.load_or_build(table_path, normalize(before.genre_matrix), 20)
+
+    write_movies(movies_path, genres[700:], start=700)
+    after = load_catalog(movies_path)
+    vectors = normalize(after.genre_matrix)
+    expected = ItemNeighborTable.build(vectors, k=20)
+    np.testing.assert_array_equal(after.genre_matrix[:700].toarray(), before.genre_matrix.toarray())
+
+    def rebuild(*args, **kwargs):
+        raise AssertionError("the table was rebuilt instead of extended")
+
+    monkeypatch.setattr(ItemNeighborTable, "build", rebuild)
+    table = ItemNeighborTable.load_or_build(table_path, vectors, 20)
+
+    np.testing.assert_array_equal(table.positions, expected.positions)
+    np.testing.assert_allclose(table.sims, expected.sims)
+    np.testing.assert_array_equal(ItemNeighborTable.load_or_build(table_path, vectors, 20).positions, expected.positions)
+
+
+def test_appending_an_unknown_genre_refits(tmp_path):
+    movies_path = tmp_path / "movies.csv"
+    write_movies(movies_path, genre_lists(50))
+    before = load_catalog(movies_path)
+    write_movies(movies_path, [["Western"]], start=50)
+    after = load_catalog(movies_path)
+
+    assert "western" in after.tfidf.get_feature_names_out()
+    assert after.genre_matrix.shape == (51, before.genre_matrix.shape[1] + 1)
@@ -0,0 +1,76 @@
+"""Recommendations rendered while OMDB lookups are still in flight must not be cached."""
+import importlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import models
+
+
+class StubOMDB(BaseHTTPRequestHandler):
+    delay = 0.0
+
+    def do_GET(self):
+        time.sleep(type(self).delay)
+        title = parse_qs(urlparse(self.path).query)["t"][0]
+        body = json.dumps({"Response": "True", "Plot": f"Stub plot for {title}.", "Poster": f"http://stub/{title}.jpg"})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def app_module(tmp_path_factory):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOMDB)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    env = {
+        "OMDB_API_KEY": "stub",
+        "OMDB_URL": f"http://127.0.0.1:{server.server_port}/",
+        "TMDB_API_KEY": "",
+        "METADATA_DEADLINE_SECONDS": "0.2",
+    }
+    saved_env = {name: os.environ.get(name) for name in env}
+    saved_db = models.DB_PATH
+    os.environ.update(env)
+    models.DB_PATH = tmp_path_factory.mktemp("db") / "smartrecs.db"
+    try:
+        import app
+
+        yield importlib.reload(app)
+    finally:
+        server.shutdown()
+        models.DB_PATH = saved_db
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def test_recommendations_past_the_deadline_are_not_cached(app_module):
+    client = app_module.app.test_client()
+    client.post("/register", data={"username": "stub", "email": "stub@example.com", "password": "password1"})
+    user_id = models.fetch_one("SELECT id FROM users WHERE username = 'stub'")["id"]
+
+    StubOMDB.delay = 1.0
+    slow = client.get("/api/recommendations").get_json()["recommendations"]
+    assert slow and not any(movie["description"].startswith("Stub plot") for movie in slow)
+    assert models.load_cached_recommendations(user_id, app_module.recommender.model_version) is None
+
+    # The lookups finish in the background and land in the metadata cache.
+    StubOMDB.delay = 0.0
+    deadline = time.time() + 10
+    while any(app_module._metadata_pending(movie) for movie in slow) and time.time() < deadline:
+        time.sleep(0.05)
+    fresh = client.get("/api/recommendations").get_json()["recommendations"]
+    assert all(movie["description"].startswith("Stub plot") for movie in fresh)
+    assert models.load_cached_recommendations(user_id, app_module.recommender.model_version) == fresh
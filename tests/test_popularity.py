@@ -0,0 +1,28 @@
+"""Cold-start popularity slices must match the catalog filters the page applies."""
+import pytest
+
+from catalog import load_catalog
+from popularity import PopularityRanking
+from ratings import RatingsStore
+from search import CatalogSearchIndex
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return load_catalog("data/movies.csv")
+
+
+@pytest.mark.parametrize(
+    "year, genre", [("2010", ""), ("2014", ""), ("", "sci"), ("", "action,adv"), ("2010", "thrill"), ("1850", "")]
+)
+def test_slices_match_the_catalog_filters(catalog, year, genre):
+    ranking = PopularityRanking.from_store(RatingsStore.read_csv("data/ratings.csv"), catalog.movies_df)
+    expected = set(CatalogSearchIndex(catalog.movies_df).search("", year, genre).tolist())
+
+    assert set(ranking.top(len(catalog.movies_df), genre=genre or None, year=year or None).tolist()) == expected
+
+
+def test_years_are_resolved_in_the_catalog(catalog):
+    years = dict(zip(catalog.movies_df["lower_title"], catalog.movies_df["year"]))
+    assert years["inception"] == "2010"
+    assert all(year.isdigit() for year in years.values())
@@ -0,0 +1,50 @@
+"""The recommendations ETag revalidates only against the live model."""
+import importlib
+import os
+
+import pytest
+
+import models
+
+
+@pytest.fixture(scope="module")
+def app_module(tmp_path_factory):
+    env = {"OMDB_API_KEY": "", "TMDB_API_KEY": ""}
+    saved_env = {name: os.environ.get(name) for name in env}
+    saved_db = models.DB_PATH
+    os.environ.update(env)
+    models.DB_PATH = tmp_path_factory.mktemp("db") / "smartrecs.db"
+    try:
+        import app
+
+        yield importlib.reload(app)
+    finally:
+        models.DB_PATH = saved_db
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def test_old_etag_is_not_current_after_refresh(app_module):
+    client = app_module.app.test_client()
+    client.post("/register", data={"username": "etag", "email": "etag@example.com", "password": "password1"})
+    movie_ids = app_module.movies_df["movie_id"].tolist()
+    client.post("/rate", data={"movie_id": movie_ids[0], "rating": 5})
+
+    first = client.get("/api/recommendations")
+    etag = first.headers["ETag"]
+    assert client.get("/api/recommendations", headers={"If-None-Match": etag}).status_code == 304
+
+    # Another worker's ratings reach this one through a refresh: a new model, same user ratings.
+    models.upsert_ratings([(10**6, movie_id, 1.0) for movie_id in movie_ids[1:6]])
+    old_model = app_module.recommender.model_version
+    app_module.model_refresher.refresh_now()
+    assert app_module.recommender.model_version != old_model
+
+    revalidated = client.get("/api/recommendations", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 200
+    assert revalidated.headers["ETag"] != etag
+    assert revalidated.get_json()["model_version"] == app_module.recommender.model_version
+    assert client.get("/api/recommendations", headers={"If-None-Match": revalidated.headers["ETag"]}).status_code == 304